@@ -0,0 +1,92 @@
+import asyncio
+import json
+import time
+from typing import List, Optional, Tuple
+
+import litellm
+
+from Code.LiteLLM.compaction import as_dict
+
+
+class LiteLLMBackend:
+    """sends the requests to the model through litellm"""
+
+    def completion(self, **kwargs):
+        return litellm.completion(**kwargs)
+
+    async def acompletion(self, **kwargs):
+        return await litellm.acompletion(**kwargs)
+
+
+class ScriptedBackend:
+    """stands in for the model without network access, answers the first request with the plan and then calls the
+    tools of the plan one after another, every response is delayed by latency seconds"""
+
+    # the canonical solution from test_ai_correct_behavior.py
+    default_plan = [
+        ("open_door", {}),
+        ("grip_object_from_above", {"object_name": "obj"}),
+        ("place_object_at_destination", {"object_name": "obj", "destination_name": "container"}),
+        ("close_door", {}),
+        ("press_button", {}),
+    ]
+
+    def __init__(self, latency: float = 0.0, plan: Optional[List[Tuple[str, dict]]] = None):
+        self.latency = latency
+        self.plan = self.default_plan if plan is None else plan
+
+    def describe_plan(self) -> str:
+        return "Plan:\n" + "\n".join(
+            f"{n + 1}. {name}({', '.join(f'{arg}={val}' for arg, val in args.items())})"
+            for n, (name, args) in enumerate(self.plan)
+        )
+
+    def respond(self, model: str, messages: List, tools: Optional[List[dict]] = None, tool_choice=None, **kwargs):
+        messages = [as_dict(message) for message in messages]
+        # every executed step answered one tool call, the conversation tells where the plan continues
+        step = sum(1 for message in messages if message.get("role") == "tool")
+        offered_tools = {tool["function"]["name"] for tool in tools or []}
+        message = {"role": "assistant", "content": None}
+        if not tools or tool_choice == "none":
+            message["content"] = self.describe_plan()
+        elif "submit_plan" in offered_tools:
+            if step > 0:
+                message["content"] = "The plan was executed."
+            else:
+                steps = json.dumps({"steps": [{"function": name, "arguments": args} for name, args in self.plan]})
+                message["tool_calls"] = [{"id": "call_plan", "type": "function",
+                                          "function": {"name": "submit_plan", "arguments": steps}}]
+        elif step >= len(self.plan):
+            message["content"] = "The plan was executed."
+        elif self.plan[step][0] not in offered_tools:
+            message["content"] = f"The plan can not be executed, {self.plan[step][0]} is not available."
+        else:
+            name, args = self.plan[step]
+            message["tool_calls"] = [{"id": f"call_{step}", "type": "function",
+                                      "function": {"name": name, "arguments": json.dumps(args)}}]
+        # rough estimate, counting the tokens properly would make the backend slower than the loop it measures
+        prompt_tokens = sum(len(str(message.get("content", ""))) for message in messages) // 4
+        completion_tokens = len(json.dumps(message)) // 4
+        return litellm.ModelResponse(
+            model=model,
+            choices=[{"index": 0, "finish_reason": "tool_calls" if "tool_calls" in message else "stop",
+                      "message": message}],
+            usage={"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                   "total_tokens": prompt_tokens + completion_tokens},
+        )
+
+    def completion(self, **kwargs):
+        time.sleep(self.latency)
+        return self.respond(**kwargs)
+
+    async def acompletion(self, **kwargs):
+        await asyncio.sleep(self.latency)
+        return self.respond(**kwargs)
+
+
+def create_backend(name: str, latency: float = 0.0):
+    if name == "litellm":
+        return LiteLLMBackend()
+    if name == "scripted":
+        return ScriptedBackend(latency=latency)
+    raise ValueError(f"unknown backend {name}")
@@ -0,0 +1,187 @@
+import json
+import sqlite3
+import time
+from contextlib import closing
+from pathlib import Path
+from typing import List, Optional, Tuple, Union
+
+from Code.LiteLLM.run_trace import read_summary
+
+INDEX_FILE = "index.sqlite"
+RUN_PREFIX = "RobocasaLLM_"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_index INTEGER PRIMARY KEY,
+    created REAL NOT NULL,
+    legacy INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS results (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    run_index INTEGER NOT NULL UNIQUE REFERENCES runs(run_index),
+    outcome TEXT NOT NULL,
+    summary TEXT
+);
+CREATE TABLE IF NOT EXISTS evaluation (
+    id INTEGER PRIMARY KEY CHECK (id = 0),
+    seq INTEGER NOT NULL,
+    passes INTEGER NOT NULL,
+    fails INTEGER NOT NULL,
+    errors INTEGER NOT NULL
+);
+"""
+
+
+def read_outcome(log_path: Path) -> str:
+    """outcome of a run that has no result in the index, from its summary or the last line of its log"""
+    summary = read_summary(log_path)
+    if summary is not None:
+        return summary["outcome"]
+    try:
+        with open(log_path / "RobocasaLLM.log") as f:
+            log = f.read()
+    except FileNotFoundError:
+        return "UNKNOWN"
+    if len(log) == 0 or log[-2] == "R":  # Error
+        return "ERROR"
+    elif log[-2] == "S":  # Success
+        return "SUCCESS"
+    elif log[-2] == "L":  # Fail
+        return "FAIL"
+    return "UNKNOWN"  # Timeout
+
+
+class BatchIndex:
+    """append-only index of the runs of one batch in Logs/<batch>/index.sqlite
+    - runs: the run indices are allocated in a transaction, concurrent runs and processes never get the same directory
+    - results: every finished run appends its outcome and summary, seq gives the order in which they were added
+    - evaluation: cursor into results and the counts up to it, an evaluation only processes the results after it
+    batches that were started before the index existed are backfilled from their RobocasaLLM_<n> directories
+    """
+
+    def __init__(self, batch_path: Union[str, Path]):
+        self.batch_path = Path(batch_path)
+        self.path = self.batch_path / INDEX_FILE
+
+    def connect(self) -> sqlite3.Connection:
+        # a connection per operation, episodes finish in arbitrary threads and processes
+        connection = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+        connection.execute("PRAGMA journal_mode=WAL")
+        if connection.execute("PRAGMA user_version").fetchone()[0] == 0:
+            self._create(connection)
+        return connection
+
+    def _create(self, connection: sqlite3.Connection) -> None:
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            # another process may have created the index while this one waited for the lock
+            if connection.execute("PRAGMA user_version").fetchone()[0] == 0:
+                for statement in SCHEMA.split(";"):
+                    if statement.strip():
+                        connection.execute(statement)
+                legacy_runs = [int(path.name[len(RUN_PREFIX):]) for path in self.batch_path.iterdir()
+                               if path.is_dir() and path.name.startswith(RUN_PREFIX)
+                               and path.name[len(RUN_PREFIX):].isdigit()]
+                connection.executemany("INSERT INTO runs (run_index, created, legacy) VALUES (?, ?, 1)",
+                                       [(run_index, time.time()) for run_index in legacy_runs])
+                connection.execute("INSERT INTO evaluation VALUES (0, 0, 0, 0, 0)")
+                connection.execute("PRAGMA user_version = 1")
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+
+    def allocate_run(self) -> Path:
+        """registers the next run of the batch and creates its directory"""
+        with closing(self.connect()) as connection:
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                run_index = connection.execute("SELECT COALESCE(MAX(run_index) + 1, 0) FROM runs").fetchone()[0]
+                connection.execute("INSERT INTO runs (run_index, created) VALUES (?, ?)", (run_index, time.time()))
+                connection.execute("COMMIT")
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+        log_path = self.batch_path / f"{RUN_PREFIX}{run_index}"
+        log_path.mkdir(parents=True)
+        return log_path
+
+    def record_result(self, log_path: Union[str, Path], outcome: str, summary: Optional[dict] = None) -> None:
+        run_index = int(Path(log_path).name[len(RUN_PREFIX):])
+        with closing(self.connect()) as connection:
+            connection.execute("INSERT OR IGNORE INTO results (run_index, outcome, summary) VALUES (?, ?, ?)",
+                               (run_index, outcome, None if summary is None else json.dumps(summary)))
+
+    def _backfill_results(self, connection: sqlite3.Connection) -> None:
+        """legacy runs are finished, their outcome is read from the files once"""
+        missing = [row[0] for row in connection.execute(
+            "SELECT run_index FROM runs WHERE legacy = 1 AND run_index NOT IN (SELECT run_index FROM results) "
+            "ORDER BY run_index"
+        )]
+        results = []
+        for run_index in missing:
+            log_path = self.batch_path / f"{RUN_PREFIX}{run_index}"
+            results.append((run_index, read_outcome(log_path), json.dumps(read_summary(log_path))))
+        connection.executemany("INSERT OR IGNORE INTO results (run_index, outcome, summary) VALUES (?, ?, ?)",
+                               results)
+
+    def count_results(self) -> int:
+        """number of finished runs"""
+        with closing(self.connect()) as connection:
+            self._backfill_results(connection)
+            return connection.execute("SELECT COUNT(*) FROM results WHERE outcome != 'UNKNOWN'").fetchone()[0]
+
+    def results(self) -> List[Tuple[int, str, Optional[dict]]]:
+        """every run of the batch with its outcome and summary, runs without a result have the outcome UNKNOWN"""
+        with closing(self.connect()) as connection:
+            self._backfill_results(connection)
+            rows = connection.execute(
+                "SELECT runs.run_index, results.outcome, results.summary FROM runs "
+                "LEFT JOIN results ON results.run_index = runs.run_index ORDER BY runs.run_index"
+            ).fetchall()
+        return [(run_index, outcome or "UNKNOWN", None if summary is None else json.loads(summary))
+                for run_index, outcome, summary in rows]
+
+    def results_since(self, seq: int) -> List[Tuple[int, int, str, Optional[dict]]]:
+        """seq, run index, outcome and summary of the results added after the given seq"""
+        with closing(self.connect()) as connection:
+            self._backfill_results(connection)
+            rows = connection.execute(
+                "SELECT seq, run_index, outcome, summary FROM results WHERE seq > ? ORDER BY seq", (seq,)
+            ).fetchall()
+        return [(seq, run_index, outcome, None if summary is None else json.loads(summary))
+                for seq, run_index, outcome, summary in rows]
+
+    def unfinished_runs(self) -> List[int]:
+        """runs without a result, still running or interrupted"""
+        with closing(self.connect()) as connection:
+            self._backfill_results(connection)
+            return [row[0] for row in connection.execute(
+                "SELECT run_index FROM runs WHERE run_index NOT IN (SELECT run_index FROM results) ORDER BY run_index"
+            )]
+
+    def evaluate(self) -> dict:
+        """counts the outcomes of the batch, only the results added since the last evaluation are processed, runs
+        without a result are still running or were interrupted and are counted as timeouts/unknown"""
+        with closing(self.connect()) as connection:
+            self._backfill_results(connection)
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                seq, passes, fails, errors = connection.execute(
+                    "SELECT seq, passes, fails, errors FROM evaluation WHERE id = 0"
+                ).fetchone()
+                for new_seq, outcome in connection.execute(
+                        "SELECT seq, outcome FROM results WHERE seq > ? ORDER BY seq", (seq,)).fetchall():
+                    seq = new_seq
+                    passes += outcome == "SUCCESS"
+                    fails += outcome == "FAIL"
+                    errors += outcome == "ERROR"
+                connection.execute("UPDATE evaluation SET seq = ?, passes = ?, fails = ?, errors = ? WHERE id = 0",
+                                   (seq, passes, fails, errors))
+                total = connection.execute("SELECT COUNT(*) FROM runs").fetchone()[0]
+                connection.execute("COMMIT")
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+        return {"passes": passes, "fails": fails, "errors": errors, "timeouts": total - passes - fails - errors,
+                "total": total}
@@ -0,0 +1,105 @@
+from typing import List, Optional
+
+import litellm
+
+
+def as_dict(message) -> dict:
+    """messages are either plain dicts or litellm Message objects (the assistant replies)"""
+    return message if isinstance(message, dict) else message.model_dump(exclude_none=True)
+
+
+def count_tokens(model: str, messages: List) -> int:
+    try:
+        return litellm.token_counter(model=model, messages=[as_dict(message) for message in messages])
+    except Exception:
+        # unknown models or message parts, a rough estimate is good enough for the cap
+        return sum(len(str(as_dict(message).get("content", ""))) for message in messages) // 4
+
+
+class NoCompaction:
+    """sends the full conversation"""
+
+    def __call__(self, messages: List) -> (List, Optional[dict]):
+        return messages, None
+
+
+class MessageCompactor:
+    """builds the messages of the next request from the full conversation without modifying it:
+    - only the latest scene image is kept, older ones are replaced by a short note
+    - tool results older than the last keep_tool_results are shortened to tool_result_chars characters
+    - if the prompt is still above max_prompt_tokens, the oldest turns after the system and task prompt are dropped
+    """
+
+    def __init__(self, model: str, keep_tool_results: int = 2, tool_result_chars: int = 100,
+                 max_prompt_tokens: Optional[int] = None, prefix_length: int = 2):
+        self.model = model
+        self.keep_tool_results = keep_tool_results
+        self.tool_result_chars = tool_result_chars
+        self.max_prompt_tokens = max_prompt_tokens
+        # system prompt and task prompt, never compacted
+        self.prefix_length = prefix_length
+
+    def __call__(self, messages: List) -> (List, dict):
+        tokens_before = count_tokens(self.model, messages)
+        compacted = self._drop_old_images(messages)
+        compacted = self._shorten_old_tool_results(compacted)
+        compacted = self._cap_tokens(compacted)
+        tokens_after = count_tokens(self.model, compacted)
+        return compacted, {"tokens_before": tokens_before, "tokens_after": tokens_after,
+                           "saved_tokens": tokens_before - tokens_after}
+
+    def _drop_old_images(self, messages: List) -> List:
+        image_positions = [
+            (i, j) for i, message in enumerate(messages) if isinstance(message, dict)
+            and isinstance(message.get("content"), list)
+            for j, part in enumerate(message["content"]) if part.get("type") == "image_url"
+        ]
+        old_images = set(image_positions[:-1])
+        if not old_images:
+            return messages
+        compacted = []
+        for i, message in enumerate(messages):
+            if any(position[0] == i for position in old_images):
+                message = {**message, "content": [
+                    {"type": "text", "text": "[older scene image removed]"} if (i, j) in old_images else part
+                    for j, part in enumerate(message["content"])
+                ]}
+            compacted.append(message)
+        return compacted
+
+    def _shorten_old_tool_results(self, messages: List) -> List:
+        tool_indices = [i for i, message in enumerate(messages)
+                        if isinstance(message, dict) and message.get("role") == "tool"]
+        old_tool_indices = set(tool_indices[:len(tool_indices) - self.keep_tool_results])
+        compacted = []
+        for i, message in enumerate(messages):
+            if i in old_tool_indices and len(message["content"]) > self.tool_result_chars:
+                message = {**message, "content": message["content"][:self.tool_result_chars] + " [truncated]"}
+            compacted.append(message)
+        return compacted
+
+    def _cap_tokens(self, messages: List) -> List:
+        if self.max_prompt_tokens is None:
+            return messages
+        # a turn starts with an assistant message and contains the tool results and scene updates that follow it,
+        # dropping whole turns keeps every tool result together with the tool call it answers
+        turn_starts = [i for i in range(self.prefix_length, len(messages))
+                       if as_dict(messages[i]).get("role") == "assistant"]
+        prefix = messages[:self.prefix_length]
+        body = messages[self.prefix_length:]
+        dropped_turns = 0
+        # the latest turn is always kept
+        while dropped_turns < len(turn_starts) - 1 and count_tokens(self.model, prefix + body) > self.max_prompt_tokens:
+            dropped_turns += 1
+            body = messages[turn_starts[dropped_turns]:]
+        return prefix + body
+
+
+def create_compactor(name: str, model: str, keep_tool_results: int = 2, max_prompt_tokens: Optional[int] = None,
+                     prefix_length: int = 2):
+    if name == "none":
+        return NoCompaction()
+    if name == "truncate":
+        return MessageCompactor(model, keep_tool_results=keep_tool_results, max_prompt_tokens=max_prompt_tokens,
+                                prefix_length=prefix_length)
+    raise ValueError(f"unknown compaction {name}")
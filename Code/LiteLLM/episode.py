@@ -0,0 +1,648 @@
+import asyncio
+from concurrent.futures import Executor, Future, ThreadPoolExecutor
+import json
+import logging
+from argparse import Namespace
+from pathlib import Path
+from sys import stdout
+import time
+from types import SimpleNamespace
+from typing import List, Optional, Tuple
+
+import litellm
+
+from Code.LiteLLM.backends import create_backend
+from Code.LiteLLM.batch_index import BatchIndex
+from Code.LiteLLM.compaction import create_compactor
+from Code.LiteLLM.utils import high_level_control_functions, all_functions, low_level_control_functions, plan_tool
+from Code.LiteLLM.image_logger import ImageLogger
+from Code.LiteLLM.request_scheduler import RequestScheduler
+from Code.LiteLLM.response_cache import ResponseCache
+from Code.LiteLLM.prompt_caching import get_cached_tokens, mark_cache_breakpoint, needs_cache_breakpoints
+from Code.LiteLLM.run_trace import RunTrace
+from Code.LiteLLM.streaming import StreamedResponse
+from Code.LiteLLM.scene_description import get_scene_description, get_scene_description_json
+
+
+def parse_arguments(arguments: str) -> Tuple[Optional[dict], Optional[str]]:
+    """the arguments of a tool call, or the error to report as its result if they are not a JSON object"""
+    try:
+        function_args = json.loads(arguments)
+    except json.JSONDecodeError as e:
+        return None, f"invalid JSON: {e}"
+    if not isinstance(function_args, dict):
+        return None, f"expected a JSON object, got {arguments}"
+    return function_args, None
+
+
+class Episode:
+    """one run of the agent loop, the LLM controls the given controller until the task is done or the limit is hit"""
+
+    def __init__(self, args: Namespace, controller, log_path: Path):
+        self.args = args
+        self.controller = controller
+        self.log_path = Path(log_path)
+
+        # file handler
+        self.file_handler = logging.FileHandler(self.log_path / 'RobocasaLLM.log', mode='w')
+
+        # console handler
+        self.console_handler = logging.StreamHandler(stdout)
+
+        # create logger, one per run so that concurrent runs don't write into each other's log files
+        self.logger = logging.getLogger(f"RobocasaLLM.{self.log_path.parent.name}.{self.log_path.name}")
+        self.logger.setLevel("INFO")
+        self.logger.addHandler(self.file_handler)
+        self.logger.addHandler(self.console_handler)
+        self.logger.propagate = False
+
+        self.vision_legacy = args.vision_legacy
+        self.vision_enabled = not self.vision_legacy and args.vision_enabled
+        self.vision_send_every_tool_call = self.vision_legacy and args.send_every_tool_call
+
+        with open(self.log_path / "args.json", mode="w") as args_file:
+            json.dump(vars(args), args_file)
+
+        self.trace = RunTrace(self.log_path)
+
+        self.image_logger = ImageLogger(controller, self.log_path, llm_size=args.llm_image_size,
+                                        llm_crop=args.llm_image_crop, detail=args.image_detail)
+
+        # requests of the batch are answered from the cache in its Logs directory if enabled, otherwise by the backend,
+        # the scheduler keeps the requests of all episodes of the process within the rate limits and retries errors
+        backend = create_backend(args.backend, latency=args.scripted_latency)
+        self.scheduler = RequestScheduler(backend.completion, backend.acompletion,
+                                          requests_per_minute=args.requests_per_minute,
+                                          tokens_per_minute=args.tokens_per_minute, max_retries=args.max_retries,
+                                          logger=self.logger)
+        if args.response_cache == "off":
+            self.response_cache = None
+            self.completion, self.acompletion = self.scheduler.completion, self.scheduler.acompletion
+        else:
+            self.response_cache = ResponseCache(args.response_cache_dir or self.log_path.parent / "ResponseCache",
+                                                args.response_cache, completion=self.scheduler.completion,
+                                                acompletion=self.scheduler.acompletion)
+            self.completion, self.acompletion = self.response_cache.completion, self.response_cache.acompletion
+
+        self.messages: List = []
+        self.available_functions = {}
+        self.tools = []
+
+        self.activate_tools = False
+        self.used_tool_calls = []
+
+        self.error_state = False
+        self.last_image_index = None
+        self.response_count = 0
+        self.response_limit = 20 if args.use_low_level_only else 11
+
+        # builds the messages of each request from the full conversation in self.messages, created in prepare
+        self.compactor = None
+        self.saved_prompt_tokens = 0
+
+        # with --stream the first tool call is executed by this thread while the rest of the response streams in
+        self.dispatcher = ThreadPoolExecutor(max_workers=1) if args.stream else None
+
+        # message of the initial scene with --prompt-caching
+        self.scene_index = None
+        self.prompt_tokens = 0
+        self.cached_prompt_tokens = 0
+
+    def prepare(self) -> None:
+        """starts the simulation and builds the prompts and the tools for this run"""
+        args = self.args
+        self.controller.start()
+
+        if args.plan_execute:
+            tool_call_rules = ("Do not call the functions directly, submit your whole plan with a single call of "
+                               "submit_plan containing the function calls in the order they should be executed. "
+                               "The steps are executed until one of them fails or raises an error, in that case you "
+                               "get a report of the failed step, the error and the current state and may submit a "
+                               "new plan for the remaining steps. ")
+            plan_instruction = "submit it."
+        elif args.batch_tool_calls:
+            tool_call_rules = ("You may use multiple function calls per response, they are executed in the given "
+                               "order. If one of them fails or raises an error, the following ones are not executed "
+                               "that you can potentially react to the error that is returned by the function. ")
+        else:
+            tool_call_rules = ("You may only use one function call per response and have to wait for "
+                               "it to finish that you can potentially react to errors that arise "
+                               "during execution and are returned by the function. If multiple "
+                               "function calls are provided, only the first one will be executed. ")
+        if not args.plan_execute:
+            plan_instruction = None
+
+        if self.vision_enabled:
+            if args.use_json:
+                scene_description = get_scene_description_json(self.image_logger, args.model,
+                                                               self.scene_description_completion)
+            else:
+                scene_description = get_scene_description(self.image_logger, args.model,
+                                                          self.scene_description_completion)
+            system_prompt = {"role": "system",
+                             "content": tool_call_rules +
+                                        "You will get a scene description from the user, given this description, "
+                                        "think of a plan on how to achieve the task and " +
+                                        (plan_instruction or "send a message containing the plan. Afterwards, "
+                                                             "begin with the execution.")
+                             }
+
+            scene_text = (f"Here's a scene description{' in JSON format' if args.use_json else ''}:\n "
+                          f"{scene_description}\n")
+            task_text = ("You are the one-armed robot with a single gripper that can only hold one thing at a time. "
+                         "Your objective is to thaw food in a microwave. "
+                         "The food object is called \"obj\" in the simulation, the microwave is called "
+                         "\"container\". "
+                         "In the end, the food should be in the microwave, the microwave should be turned on "
+                         "and you should be at least 25 cm away from the object. "
+                         "After formulating your plan, immediately begin execution.")
+            user_prompt = {"role": "user", "content": [
+                {
+                    "type": "text",
+                    "text": scene_text + task_text
+                }
+            ]
+                           }
+        else:
+            # You may only use one function call per response and have to wait for it to finish that you can
+            #  potentially react to errors that arise during execution and are returned by the function.
+            # Before attempting to call a function, send one message reasoning which step would be useful to achieve
+            #  your goal. Afterward, execute the next logical step.
+            system_prompt = {"role": "system", "content":
+                             tool_call_rules +
+                             f"First,{' describe the image provided, then' if self.vision_legacy else ''} "
+                             "think of a plan on how to achieve the task and " +
+                             (plan_instruction or
+                              f"send a message containing the {'image description and ' if self.vision_legacy else ''}"
+                              "plan. Afterwards, begin with the execution.")
+                             }
+
+            # The microwave door is closed.
+            # You should regularly check if the object didn't fall down, as that may happen often.
+            scene_text = None
+            door_state = " The microwave door is closed." if not self.vision_legacy and not self.vision_enabled else ""
+            user_prompt = {"role": "user", "content": [
+                    {
+                        "type": "text",
+                        "text":
+                            "You are a one-armed robot with a single gripper. Your objective is to thaw food in a "
+                            "microwave. "
+                            "The object is called \"obj\" in the simulation, the microwave is called \"container\". "
+                            "In the end, the food should be in the microwave, the microwave should be turned on "
+                            "and you should be at least 25 cm away from the object."
+                            f"{door_state}"
+                    }
+                ]
+            }
+        if args.prompt_caching:
+            self.messages = self.cache_friendly_messages(system_prompt, user_prompt, scene_text)
+        else:
+            self.messages = [system_prompt, user_prompt]
+            if self.vision_legacy:
+                self.image_logger.add_current_scene_to_message(self.messages[1])
+        # the compactor never touches the initial messages
+        self.compactor = create_compactor(args.compaction, args.model, keep_tool_results=args.keep_tool_results,
+                                          max_prompt_tokens=args.max_prompt_tokens, prefix_length=len(self.messages))
+
+        self.logger.info(f"Using system prompt:\n{system_prompt['content']}\n")
+        # the whole task text with the scene description, with --prompt-caching they are separate messages
+        self.logger.info(f"Using microwave prompt:\n{user_prompt['content'][0]['text']}")
+
+        if args.use_all_functions and args.use_low_level_only:
+            raise ValueError("low level functions cannot be used exclusively and additionally at the same time!")
+        if args.use_all_functions:
+            self.available_functions, self.tools = all_functions(self.controller)
+        elif args.use_low_level_only:
+            self.available_functions, self.tools = low_level_control_functions(self.controller)
+        else:
+            self.available_functions, self.tools = high_level_control_functions(self.controller)
+
+        assert len(self.available_functions) == len(self.tools)
+        if args.plan_execute:
+            # the function tools are only sent for their descriptions, the model is forced to call submit_plan
+            self.tools = self.tools + [plan_tool(self.tools)]
+
+    def cache_friendly_messages(self, system_prompt: dict, user_prompt: dict, scene_text) -> List:
+        """orders the messages so that the part that is identical for every turn and every run of the batch comes
+        first (system prompt, tools, task text) and is followed by the scene of this run, providers cache the longest
+        common prefix of consecutive requests"""
+        task_prompt = {"role": "user", "content": [
+            {"type": "text", "text": user_prompt["content"][0]["text"][len(scene_text or ""):]}
+        ]}
+        # a copy, the breakpoint turns the content into a list and the system prompt is logged as text afterwards
+        messages = [dict(system_prompt), task_prompt]
+        if scene_text is not None:
+            messages.append({"role": "user", "content": [{"type": "text", "text": scene_text}]})
+        elif self.vision_legacy:
+            scene_prompt = {"role": "user", "content": [{"type": "text", "text": "This is the initial scene."}]}
+            self.image_logger.add_current_scene_to_message(scene_prompt)
+            messages.append(scene_prompt)
+        self.scene_index = 2 if len(messages) > 2 else None
+        if needs_cache_breakpoints(self.args.model):
+            # the system prompt comes after the tools, the task text after both
+            mark_cache_breakpoint(messages[0])
+            mark_cache_breakpoint(task_prompt)
+        return messages
+
+    def is_running(self) -> bool:
+        # fixed limit of messages
+        return not self.controller.check_successful() and self.response_count <= self.response_limit
+
+    def completion_kwargs(self) -> dict:
+        """arguments for the next completion call"""
+        if self.args.use_reasoning:
+            if False and "gpt-5" in self.args.model:  # off for testing
+                reasoning = {"reasoning": {"effort": "medium"}}
+            else:
+                reasoning = {"reasoning_effort": "medium"}
+        else:
+            reasoning = dict()
+        return dict(
+            model=self.args.model,
+            messages=self.request_messages(),
+            **self.tool_kwargs(),
+            **reasoning
+        )
+
+    def tool_kwargs(self) -> dict:
+        if self.args.plan_execute:
+            return dict(tools=self.tools, tool_choice={"type": "function", "function": {"name": "submit_plan"}})
+        if self.args.prompt_caching:
+            # the tools are part of the cached prefix, they are sent from the first request on and only disabled
+            # until the plan was sent
+            return dict(tools=self.tools, tool_choice="auto" if self.activate_tools else "none")
+        return dict(tools=self.tools if self.activate_tools else None)
+
+    def request_messages(self) -> List:
+        """runs the compaction stage over the conversation and logs how many prompt tokens it saved"""
+        messages, statistics = self.compactor(self.messages)
+        if statistics is not None:
+            self.saved_prompt_tokens += statistics["saved_tokens"]
+            self.logger.info(f"Compacted prompt from {statistics['tokens_before']} to {statistics['tokens_after']} "
+                             f"tokens")
+        return messages
+
+    def can_dispatch_early(self) -> bool:
+        # only in the default mode the first tool call is all that is executed of the response
+        return self.activate_tools and not (self.args.batch_tool_calls or self.args.plan_execute)
+
+    def dispatch(self, tool_call: Optional[Tuple[str, dict]]) -> Optional[Future]:
+        if tool_call is None or tool_call[0] not in self.available_functions:
+            return None
+        name, function_args = tool_call
+        self.logger.info(f"Executing {name} while the response is streamed")
+        return self.dispatcher.submit(self.call_function, name, function_args)
+
+    def scene_description_completion(self, **kwargs):
+        start = time.perf_counter()
+        response = self.completion(**kwargs)
+        self.trace.llm_call("scene_description", time.perf_counter() - start, response)
+        return response
+
+    def request(self) -> (object, Optional[Future]):
+        """requests the next response and records it in the run trace, returns the response and the tool call
+        that was started while it was streamed"""
+        kwargs = self.completion_kwargs()
+        start = time.perf_counter()
+        if self.args.stream:
+            response, early_call = self.stream_completion(**kwargs)
+        else:
+            response, early_call = self.completion(**kwargs), None
+        self.trace.llm_call("agent", time.perf_counter() - start, response)
+        return response, early_call
+
+    async def arequest(self) -> (object, Optional[Future]):
+        kwargs = self.completion_kwargs()
+        start = time.perf_counter()
+        if self.args.stream:
+            response, early_call = await self.astream_completion(**kwargs)
+        else:
+            response, early_call = await self.acompletion(**kwargs), None
+        self.trace.llm_call("agent", time.perf_counter() - start, response)
+        return response, early_call
+
+    def stream_kwargs(self) -> dict:
+        # the usage of streamed responses is only sent on request, the trace and the rate limits need it
+        return dict(stream=True, stream_options={"include_usage": True})
+
+    def stream_completion(self, **kwargs) -> (object, Optional[Future]):
+        """streams the response and starts the first tool call as soon as its arguments are complete, returns the
+        complete response and the future of the started tool call"""
+        stream = self.completion(**kwargs, **self.stream_kwargs())
+        if isinstance(stream, litellm.ModelResponse):  # backends that don't stream, e.g. the scripted one
+            return stream, None
+        streamed_response = StreamedResponse()
+        early_call = None
+        for chunk in stream:
+            streamed_response.add(chunk)
+            if early_call is None and self.can_dispatch_early():
+                early_call = self.dispatch(streamed_response.first_complete_tool_call())
+        return streamed_response.build(kwargs["messages"]), early_call
+
+    async def astream_completion(self, **kwargs) -> (object, Optional[Future]):
+        """same as stream_completion, but awaits the chunks through acompletion"""
+        stream = await self.acompletion(**kwargs, **self.stream_kwargs())
+        if isinstance(stream, litellm.ModelResponse):
+            return stream, None
+        streamed_response = StreamedResponse()
+        early_call = None
+        async for chunk in stream:
+            streamed_response.add(chunk)
+            if early_call is None and self.can_dispatch_early():
+                early_call = self.dispatch(streamed_response.first_complete_tool_call())
+        return streamed_response.build(kwargs["messages"]), early_call
+
+    def handle_response(self, response, early_call: Optional[Future] = None) -> None:
+        """logs the response of the LLM and executes the first tool call it contains, unless it was already started
+        while the response was streamed (early_call)"""
+        self.response_count += 1
+        # response.usage contains tokens
+        if self.args.prompt_caching:
+            self.log_cached_tokens(response)
+        self.logger.info(f"\nLLM Response:\n{response.choices[0].message.content}")
+        response_message = response.choices[0].message
+        tool_calls = response_message.tool_calls
+
+        # Note: the JSON response may not always be valid; be sure to handle errors
+        self.messages.append(response_message)  # extend conversation with assistant's reply
+
+        # Step 2: check if the model wanted to call a function
+        if tool_calls:
+            self.logger.info("LLM wants to execute tool calls")
+            self.logger.info("\nTool calls:")
+            # parsed once, arguments that are not a JSON object become the result of their call
+            arguments = []
+            for n, tool_call in enumerate(tool_calls[:]):  # create a copy of tool_calls
+                name = tool_call.function.name
+                f_args, error = parse_arguments(tool_call.function.arguments)
+                arguments.append((f_args, error))
+                skipped = n > 0 and not (self.args.batch_tool_calls or self.args.plan_execute)
+                color = "\033[36m"
+                reset = "\033[0m"
+                call = f"{name}({', '.join([f'{arg}={val}' for arg, val in f_args.items()])})" if error is None \
+                    else f"{name} with invalid arguments, {error}"
+                self.logger.info(f"{color + 'Will not be executed: ' if skipped else ''}{call}"
+                                 f"{reset if skipped else ''}")
+                if skipped:
+                    tool_calls.pop()  # pop one element for each element after the first one
+
+            if self.args.plan_execute:
+                self.execute_plans(tool_calls, arguments)
+            elif self.args.batch_tool_calls:
+                self.execute_tool_calls(tool_calls, arguments)
+            else:
+                # Step 3: call the function
+
+                # Step 4: send the info for each function call and function response to the model
+                tool_call = tool_calls[0]
+                function_name = tool_call.function.name
+                function_args, error = arguments[0]
+                if early_call is not None:
+                    function_response = early_call.result()
+                elif error is not None:
+                    function_response = f"Error: invalid arguments, {error}"
+                else:
+                    function_response = self.call_function(function_name, function_args)
+                self.messages.append(
+                    {
+                        "tool_call_id": tool_call.id,
+                        "role": "tool",
+                        "name": function_name,
+                        "content": str(function_response),
+                    }
+                )  # extend conversation with function response
+
+                self.used_tool_calls.append(tool_call)
+
+            if self.vision_legacy or self.vision_enabled or self.args.log_pictures:
+                image = self.image_logger.get_image()
+                if self.vision_send_every_tool_call:
+                    message = {"role": "user", "content": [
+                        {
+                            "type": "text",
+                            "text": "This is the current scene, you may continue the task according to the situation "
+                                    "after checking if everything is correct and telling me if the last action was "
+                                    "successful."
+                        }
+                    ]}
+                    self.image_logger.add_llm_image_to_message(message, image)
+                    if self.last_image_index is None:
+                        # with --prompt-caching the initial scene has its own message after the cached prefix
+                        self.messages[self.scene_index or 1]["content"].pop()
+                    else:
+                        self.messages.pop(self.last_image_index)
+                    self.last_image_index = len(self.messages)
+                    self.messages.append(message)
+        else:
+            self.logger.info("LLM is reasoning")
+            self.logger.info(f"\nLLM Reasoning:\n{response.choices[0].message.content}")
+            self.activate_tools = True
+
+    def call_function(self, function_name: str, function_args: dict):
+        """executes the function and records it in the run trace"""
+        start = time.perf_counter()
+        try:
+            function_response = self.available_functions[function_name](**function_args)
+        except Exception as e:
+            self.trace.tool_call(function_name, function_args, time.perf_counter() - start, error=e)
+            raise
+        self.trace.tool_call(function_name, function_args, time.perf_counter() - start, function_response)
+        return function_response
+
+    def run_function(self, function_name: str, function_args: dict) -> (object, bool):
+        """returns the result of the function and if it failed, i.e. returned False or raised"""
+        try:
+            function_response = self.call_function(function_name, function_args)
+        except Exception as e:
+            self.logger.info(f"{function_name} raised an error:\n{e}")
+            return f"Error: {e}", True
+        return function_response, function_response is False
+
+    def execute_tool_calls(self, tool_calls, arguments: List[Tuple[Optional[dict], Optional[str]]]) -> None:
+        """executes the tool calls in the given order until one of them returns False or raises, every tool call
+        gets a result, the ones after the failure are reported as not executed"""
+        failed = False
+        for tool_call, (function_args, error) in zip(tool_calls, arguments):
+            function_name = tool_call.function.name
+            if failed:
+                function_response = "Not executed, a previous function call failed."
+            else:
+                self.used_tool_calls.append(tool_call)
+                if error is not None:
+                    function_response, failed = f"Error: invalid arguments, {error}", True
+                else:
+                    function_response, failed = self.run_function(function_name, function_args)
+            self.messages.append(
+                {
+                    "tool_call_id": tool_call.id,
+                    "role": "tool",
+                    "name": function_name,
+                    "content": str(function_response),
+                }
+            )
+
+    def execute_plans(self, tool_calls, arguments: List[Tuple[Optional[dict], Optional[str]]]) -> None:
+        """executes the plan of the first submit_plan call, the result of the call is a report of the execution"""
+        plan_executed = False
+        for tool_call, (plan, error) in zip(tool_calls, arguments):
+            if tool_call.function.name != "submit_plan":
+                function_response = "Not executed, submit the function calls as a plan with submit_plan."
+            elif plan_executed:
+                function_response = "Not executed, only one plan per response is executed."
+            else:
+                function_response = self.execute_submitted_plan(plan, error)
+                plan_executed = True
+            self.messages.append(
+                {
+                    "tool_call_id": tool_call.id,
+                    "role": "tool",
+                    "name": tool_call.function.name,
+                    "content": function_response,
+                }
+            )
+
+    def execute_submitted_plan(self, plan: Optional[dict], error: Optional[str]) -> str:
+        """executes the plan of the submit_plan arguments, malformed arguments are reported instead"""
+        if error is not None:
+            report = f"Plan not executed, the arguments are invalid, {error}. {self.state_report()}"
+        elif not isinstance(plan.get("steps", []), list):
+            report = f"Plan not executed, the arguments must be an object with a list of steps. {self.state_report()}"
+        else:
+            return self.execute_plan(plan.get("steps", []))
+        self.logger.info(report)
+        return report
+
+    def execute_plan(self, steps: List[dict]) -> str:
+        """runs the steps locally until one of them fails and returns a compact report for the LLM"""
+        for n, step in enumerate(steps):
+            function_args = (step.get("arguments") or {}) if isinstance(step, dict) else None
+            if not isinstance(function_args, dict):
+                report = (f"Step {n + 1} of {len(steps)} failed: {json.dumps(step)} is not an object with a function "
+                          f"name and an object of arguments. The steps before were executed. {self.state_report()}")
+                self.logger.info(report)
+                return report
+            function_name = step.get("function")
+            call = f"{function_name}({', '.join([f'{arg}={val}' for arg, val in function_args.items()])})"
+            self.logger.info(f"Executing step {n + 1} of the plan: {call}")
+            # same shape as the tool calls of the response, the steps are listed at the end of a failed run
+            self.used_tool_calls.append(SimpleNamespace(
+                function=SimpleNamespace(name=function_name, arguments=json.dumps(function_args))
+            ))
+            function_response, failed = self.run_function(function_name, function_args)
+            if failed:
+                report = (f"Step {n + 1} of {len(steps)} failed: {call} returned {function_response}. "
+                          f"The steps before were executed. {self.state_report()}")
+                self.logger.info(report)
+                return report
+        if self.controller.check_successful():
+            return f"All {len(steps)} steps were executed, the task is accomplished."
+        return f"All {len(steps)} steps were executed, but the task is not accomplished yet. {self.state_report()}"
+
+    def state_report(self) -> str:
+        return (f"Current state: object inside the microwave: {self.controller.check_object_in_microwave()}, "
+                f"microwave button was pressed: {self.controller.check_button_pressed()}, "
+                f"gripper is at least 25cm away from the door: "
+                f"{self.controller.check_gripper_away_from_microwave()}, "
+                f"gripping an object: {self.controller.check_gripping_object()}.")
+
+    def get_state(self) -> dict:
+        """the check_* breakdown of the outcome, a finished episode was already reset by the controller, so the
+        values are taken from the snapshot before that reset"""
+        try:
+            return self.controller.get_final_state()
+        except Exception:
+            # e.g. the simulation of the run is not reachable anymore
+            return dict.fromkeys(["object_in_microwave", "button_pressed", "gripper_away_from_microwave"])
+
+    def log_cached_tokens(self, response) -> None:
+        prompt_tokens, cached_tokens, cache_creation_tokens = get_cached_tokens(getattr(response, "usage", None))
+        self.prompt_tokens += prompt_tokens
+        self.cached_prompt_tokens += cached_tokens
+        self.logger.info(f"Prompt tokens: {prompt_tokens} (cached: {cached_tokens}, "
+                         f"uncached: {prompt_tokens - cached_tokens}"
+                         f"{'' if cache_creation_tokens is None else f', written to cache: {cache_creation_tokens}'})")
+
+    def fail(self, e: Exception) -> None:
+        self.logger.error(f"Execution failed and yielded following error:\n{e}")
+        self.error_state = True
+
+    def log_statistics(self) -> None:
+        """logged before the outcome, the outcome has to stay the last line of the log"""
+        if self.args.compaction != "none":
+            self.logger.info(f"Compaction saved {self.saved_prompt_tokens} prompt tokens in total")
+        if self.scheduler.retries:
+            self.logger.info(f"Retried {self.scheduler.retries} requests")
+        if self.response_cache is not None:
+            self.logger.info(f"Response cache: {self.response_cache.hits} hits, {self.response_cache.misses} misses")
+        if self.args.prompt_caching:
+            self.logger.info(f"Prompt tokens in total: {self.prompt_tokens} (cached: {self.cached_prompt_tokens}, "
+                             f"uncached: {self.prompt_tokens - self.cached_prompt_tokens})")
+
+    def finish(self) -> None:
+        """logs the outcome of the run and stops the simulation"""
+        try:
+            if self.dispatcher is not None:
+                # a tool call started while streaming may still run if the request failed afterwards
+                self.dispatcher.shutdown(wait=True)
+            self.log_statistics()
+            if self.error_state:
+                outcome = "ERROR"
+                self.logger.info("ERROR")
+            elif self.controller.check_successful():
+                outcome = "SUCCESS"
+                self.logger.info("Task accomplished successfully!")
+                self.logger.info("SUCCESS")
+            else:
+                outcome = "FAIL"
+                self.logger.info("Task failed after fifteen messages...\n"
+                                 "Current State:\n"
+                                 f"Object inside the microwave: {self.controller.check_object_in_microwave()}\n"
+                                 f"Microwave button was pressed: {self.controller.check_button_pressed()}\n"
+                                 f"Gripper is at least 25cm away from the door: "
+                                 f"{self.controller.check_gripper_away_from_microwave()}\n")
+                self.logger.info("Manually check if the procedure was correct:")
+                for tool_call in self.used_tool_calls:
+                    name = tool_call.function.name
+                    args, error = parse_arguments(tool_call.function.arguments)
+                    if error is not None:
+                        self.logger.info(f"{name} with invalid arguments, {error}")
+                    else:
+                        self.logger.info(f"{name}({', '.join([f'{arg}={val}' for arg, val in args.items()])})")
+                self.logger.info("FAIL")
+            summary = self.trace.outcome(outcome, self.get_state(), self.response_count)
+            BatchIndex(self.log_path.parent).record_result(self.log_path, outcome, summary)
+        finally:
+            try:
+                # also when the outcome could not be recorded, the simulation would keep the controller busy
+                self.controller.stop()
+            finally:
+                self.trace.close()
+                self.image_logger.close()
+                self.logger.removeHandler(self.file_handler)
+                self.logger.removeHandler(self.console_handler)
+                self.file_handler.close()
+
+    def run(self) -> None:
+        try:
+            self.prepare()
+            while self.is_running():
+                self.handle_response(*self.request())
+        except Exception as e:
+            self.fail(e)
+        finally:
+            self.finish()
+
+    async def run_async(self, executor: Optional[Executor] = None) -> None:
+        """same as run, but awaits the model through acompletion and moves the blocking controller calls to
+        a worker thread, so that other episodes in the same event loop continue in the meantime, a controller in this
+        process needs its own single thread executor, the offscreen context of its renderer is bound to one thread"""
+        loop = asyncio.get_running_loop()
+        try:
+            await loop.run_in_executor(executor, self.prepare)
+            while await loop.run_in_executor(executor, self.is_running):
+                response, early_call = await self.arequest()
+                await loop.run_in_executor(executor, self.handle_response, response, early_call)
+        except Exception as e:
+            self.fail(e)
+        finally:
+            await loop.run_in_executor(executor, self.finish)
@@ -1,5 +1,8 @@
 from pathlib import Path
 
+from Code.LiteLLM.batch_index import BatchIndex
+from Code.LiteLLM.results_store import build_results_store
+
 batches = []
 
 passes_list = []
@@ -13,22 +16,12 @@ sim_fail = []
 for path in Path("Logs").iterdir():
     if "_" in path.name:
         batches.append(path.name)
-        fails = 0
-        passes = 0
-        errors = 0
-        total = 0
-        for iteration in path.iterdir():
-            total += 1
-            with open(iteration/"RobocasaLLM.log") as f:
-                log = f.read()
-            if len(log) == 0 or log[-2] == "R":  # Error
-                errors += 1
-            elif log[-2] == "S":  # Success
-                passes += 1
-            elif log[-2] == "L":  # Fail
-                fails += 1
-            else:  # Timeout
-                pass
+        # only the runs that finished since the last evaluation are read, older batches are indexed on first use
+        counts = BatchIndex(path).evaluate()
+        passes = counts["passes"]
+        fails = counts["fails"]
+        errors = counts["errors"]
+        total = counts["total"]
 
         passes_list.append(str(passes))
         fails_list.append(str(fails))
@@ -42,3 +35,6 @@ with open("results_raw.csv", "w") as f:
     f.write(f"Fails;red,{','.join(fails_list)}\n")
     f.write(f"Errors;orange,{','.join(errors_list)}\n")
     f.write(f"Timeouts;gray,{','.join(timeout_list)}")
+
+# one row per run for the table, plot and latency/cost reports, only the new results are appended
+build_results_store(Path("Logs"))
@@ -1,49 +1,139 @@
 import base64
 from io import BytesIO
+import logging
 from pathlib import Path
-from typing import Union
+from queue import Queue
+import threading
+from typing import Optional, Tuple, Union
 
 from PIL import Image
 
 from Code.robocasa_env.main import Controller
 
+logger = logging.getLogger(__name__)
+
+
+class EncodedImage:
+    """a rendered frame that is JPEG-encoded exactly once, the bytes are reused for the log and the data URL"""
+
+    def __init__(self, image: Image.Image):
+        self.image = image
+        buffered = BytesIO()
+        image.save(buffered, format="JPEG")
+        self.jpeg = buffered.getvalue()
+        self._base64 = None
+        # downscaled/cropped versions for the LLM, keyed by (size, crop)
+        self.variants = {}
+
+    @property
+    def base64(self) -> str:
+        if self._base64 is None:
+            self._base64 = base64.b64encode(self.jpeg).decode("utf-8")
+        return self._base64
+
 
 class ImageLogger:
-    def __init__(self, controller: Controller, log_path: Union[str, Path]):
+    """renders and logs the frames of a run, close() or leaving the with block waits until they are written"""
+
+    def __init__(self, controller: Controller, log_path: Union[str, Path], queue_size: int = 16,
+                 llm_size: Optional[Tuple[int, int]] = None, llm_crop: Optional[Tuple[int, int, int, int]] = None,
+                 detail: str = "auto"):
         self.controller = controller
         self.log_path = Path(log_path)
         self.number_of_images = 0
 
-    def get_image(self):
-        image = Image.fromarray(self.controller.get_vision_data())
+        # frames are logged at render resolution, the LLM gets them cropped to llm_crop (left, upper, right, lower)
+        # and scaled down to fit into llm_size (width, height) with the given detail level
+        self.llm_size = None if llm_size is None else tuple(llm_size)
+        self.llm_crop = None if llm_crop is None else tuple(llm_crop)
+        self.detail = detail
+
+        # images are written by a background thread, the agent loop only blocks if queue_size writes are pending
+        self.write_queue = Queue(maxsize=queue_size)
+        self.writer = None
+
+    def get_image(self) -> EncodedImage:
+        image = EncodedImage(Image.fromarray(self.controller.get_vision_data()))
         self.save_image(image)
         return image
 
     @staticmethod
-    def to_base64_image(image: Image):
-        buffered = BytesIO()
-        image.save(buffered, format="JPEG")
-        return base64.b64encode(buffered.getvalue()).decode("utf-8")
+    def to_base64_image(image: Union[EncodedImage, Image.Image]):
+        if not isinstance(image, EncodedImage):
+            image = EncodedImage(image)
+        return image.base64
 
     def get_base64_image(self):
         image = self.get_image()
         return ImageLogger.to_base64_image(image)
 
     @staticmethod
-    def add_image_to_message(message: dict, image: Image):
+    def add_image_to_message(message: dict, image: Union[EncodedImage, Image.Image], detail: str = "auto"):
         b64_image = ImageLogger.to_base64_image(image)
         message["content"].append({
             "type": "image_url",
             "image_url": {
-                "url": f"data:image/jpeg;base64,{b64_image}", "detail": "auto"
+                "url": f"data:image/jpeg;base64,{b64_image}", "detail": detail
             }
         })
         return image
 
+    def to_llm_image(self, image: Union[EncodedImage, Image.Image]) -> EncodedImage:
+        """crops and downscales the image according to the settings of this logger, the result is cached on the image"""
+        if not isinstance(image, EncodedImage):
+            image = EncodedImage(image)
+        if self.llm_size is None and self.llm_crop is None:
+            return image
+        key = (self.llm_size, self.llm_crop)
+        if key not in image.variants:
+            llm_image = image.image
+            if self.llm_crop is not None:
+                llm_image = llm_image.crop(self.llm_crop)
+            if self.llm_size is not None:
+                llm_image = llm_image.copy()
+                llm_image.thumbnail(self.llm_size, Image.LANCZOS)  # keeps the aspect ratio, never upscales
+            image.variants[key] = EncodedImage(llm_image)
+        return image.variants[key]
+
+    def add_llm_image_to_message(self, message: dict, image: Union[EncodedImage, Image.Image]):
+        """adds the LLM version of the image with the configured detail level"""
+        ImageLogger.add_image_to_message(message, self.to_llm_image(image), self.detail)
+        return image
+
     def add_current_scene_to_message(self, message: dict):
-        return ImageLogger.add_image_to_message(message, self.get_image())
+        return self.add_llm_image_to_message(message, self.get_image())
 
-    def save_image(self, image: Image):
-        image.save(self.log_path / f"Image_{self.number_of_images}.jpg", format="JPEG")
+    def save_image(self, image: Union[EncodedImage, Image.Image]):
+        if not isinstance(image, EncodedImage):
+            image = EncodedImage(image)
+        if self.writer is None:
+            self.writer = threading.Thread(target=self._write_images, daemon=True)
+            self.writer.start()
+        self.write_queue.put((self.log_path / f"Image_{self.number_of_images}.jpg", image.jpeg))
         self.number_of_images += 1
 
+    def _write_images(self):
+        while True:
+            item = self.write_queue.get()
+            if item is None:
+                break
+            path, jpeg = item
+            try:
+                with open(path, mode="wb") as image_file:
+                    image_file.write(jpeg)
+            except Exception:
+                # the queue is drained anyway, otherwise the agent loop would block on the next full queue
+                logger.exception(f"Could not write {path}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """waits until all pending images are written to disk"""
+        if self.writer is not None:
+            self.write_queue.put(None)
+            self.writer.join()
+            self.writer = None
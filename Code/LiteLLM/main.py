@@ -1,23 +1,19 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from os import environ
-from typing import List
 import argparse
 from pathlib import Path
+from queue import Queue
 
-import litellm
-import json
-import logging
-from sys import stdout
-
-from Code.LiteLLM.utils import high_level_control_functions, all_functions, low_level_control_functions
-from Code.LiteLLM.image_logger import ImageLogger
+from Code.LiteLLM.batch_index import BatchIndex
+from Code.LiteLLM.episode import Episode
 from Code.robocasa_env.main import Controller
-from Code.LiteLLM.scene_description import get_scene_description, get_scene_description_json
+from Code.robocasa_env.pool import ControllerPool
 
 cur_dir = Path(__file__).parent
 logs_dir = cur_dir / "Logs"
 
-environ["OPENAI_API_KEY"] = open(cur_dir / "API_KEY", mode="r").read()
-
 parser = argparse.ArgumentParser(
                     prog='AutoBatchRobocasaLLM',
                     description='Executes the given batch with the current configuration')
@@ -33,228 +29,147 @@ parser.add_argument('-R', '--use-reasoning', action='store_true')
 parser.add_argument('-s', '--send-every-tool-call', action='store_true')  # either images or scene diffs
 parser.add_argument('-a', '--use-all-functions', action='store_true')
 parser.add_argument('-l', '--use-low-level-only', action='store_true')
-
-
-args = parser.parse_args()
-
-batch_name = args.batch_name  # leave empty to save in Logs directly
-batch_path = logs_dir / batch_name
-batch_path.mkdir(parents=True, exist_ok=True)
-number_of_logs = sum(
-    1 for f in batch_path.iterdir()
-    if f.is_dir() and f.name.startswith("RobocasaLLM_")
-)
-log_path = batch_path / f"RobocasaLLM_{number_of_logs}"
-log_path.mkdir(parents=True)
-
-# file handler
-file_handler = logging.FileHandler(log_path / 'RobocasaLLM.log', mode='w')
-
-# console handler
-console_handler = logging.StreamHandler(stdout)
-
-# create logger
-logger = logging.getLogger("RobocasaLLM")
-logger.setLevel("INFO")
-logger.addHandler(file_handler)
-logger.addHandler(console_handler)
-logger.propagate = False
-
-vision_legacy = args.vision_legacy
-vision_enabled = not vision_legacy and args.vision_enabled
-vision_send_every_tool_call = vision_legacy and args.send_every_tool_call
-headless = not args.renderer
-
-with open(log_path / "args.json", mode="w") as args_file:
-    json.dump(vars(args), args_file)
-
-controller = Controller(headless=headless)
-controller.start()
-
-image_logger = ImageLogger(controller, log_path)
-
-if vision_enabled:
-    if args.use_json:
-        scene_description = get_scene_description_json(image_logger, args.model)
-    else:
-        scene_description = get_scene_description(image_logger, args.model)
-    system_prompt = {"role": "system",
-                     "content": "You may only use one function call per response and have to wait for "
-                                "it to finish that you can potentially react to errors that arise "
-                                "during execution and are returned by the function. If multiple "
-                                "function calls are provided, only the first one will be executed. "
-                                "You will get a scene description from the user, given this description, "
-                                "think of a plan on how to achieve the task and send a message "
-                                "containing the plan. Afterwards, begin with the execution."
-                     }
-
-    user_prompt = {"role": "user", "content": [
-        {
-            "type": "text",
-            "text": f"Here's a scene description{' in JSON format' if args.use_json else ''}:\n {scene_description}\n"
-                    "You are the one-armed robot with a single gripper that can only hold one thing at a time. "
-                    "Your objective is to thaw food in a microwave. "
-                    "The food object is called \"obj\" in the simulation, the microwave is called \"container\". "
-                    "In the end, the food should be in the microwave, the microwave should be turned on "
-                    "and you should be at least 25 cm away from the object. "
-                    "After formulating your plan, immediately begin execution."
-        }
-    ]
-                   }
-else:
-    # You may only use one function call per response and have to wait for it to finish that you can potentially react
-    #  to errors that arise during execution and are returned by the function.
-    # Before attempting to call a function, send one message reasoning which step would be useful to achieve your goal.
-    #  Afterward, execute the next logical step.
-    system_prompt = {"role": "system", "content":
-                     "You may only use one function call per response and have to wait for "
-                     "it to finish that you can potentially react to errors that arise "
-                     "during execution and are returned by the function. If multiple "
-                     "function calls are provided, only the first one will be executed. "
-                     f"First,{' describe the image provided, then' if vision_legacy else ''} "
-                     "think of a plan on how to achieve the task and send a message "
-                     f"containing the {'image description and ' if vision_legacy else ''}"
-                     "plan. Afterwards, begin with the execution."
-                     }
-
-    # The microwave door is closed.
-    # You should regularly check if the object didn't fall down, as that may happen often.
-    user_prompt = {"role": "user", "content": [
-            {
-                "type": "text",
-                "text":
-                    "You are a one-armed robot with a single gripper. Your objective is to thaw food in a microwave. "
-                    "The object is called \"obj\" in the simulation, the microwave is called \"container\". "
-                    "In the end, the food should be in the microwave, the microwave should be turned on "
-                    "and you should be at least 25 cm away from the object."
-                    f"{' The microwave door is closed.' if not vision_legacy and not vision_enabled else ''}"
-            }
-        ]
-    }
-messages: List = [system_prompt, user_prompt]
-if vision_legacy:
-    image_logger.add_current_scene_to_message(messages[1])
-
-logger.info(f"Using system prompt:\n{system_prompt['content']}\n")
-logger.info(f"Using microwave prompt:\n{messages[1]['content'][0]['text']}")
-
-if args.use_all_functions and args.use_low_level_only:
-    raise ValueError("low level functions cannot be used exclusively and additionally at the same time!")
-if args.use_all_functions:
-    available_functions, tools = all_functions(controller)
-elif args.use_low_level_only:
-    available_functions, tools = low_level_control_functions(controller)
-else:
-    available_functions, tools = high_level_control_functions(controller)
-
-assert len(available_functions) == len(tools)
-
-activate_tools = False
-used_tool_calls = []
-
-error_state = False
-last_image_index = None
-response_count = 0
-response_limit = 20 if args.use_low_level_only else 11
-try:
-    while not controller.check_successful() and response_count <= response_limit:  # fixed limit of fifteen messages
-        if args.use_reasoning:
-            if False and "gpt-5" in args.model:  # off for testing
-                reasoning = {"reasoning": {"effort": "medium"}}
+# execute all tool calls of a response in order, stopping at the first failure, instead of only the first one
+parser.add_argument('--batch-tool-calls', action='store_true')
+# the model submits the whole plan with one call, the LLM is only asked again if a step fails
+parser.add_argument('--plan-execute', action='store_true')
+# stream the responses and start the first tool call as soon as it is complete
+parser.add_argument('--stream', action='store_true')
+parser.add_argument('--synchronous', action='store_true')  # step the simulation inside the primitives, reproducible
+parser.add_argument('--seed', type=int, default=None)
+parser.add_argument('-n', '--num-runs', type=int, default=1)  # number of runs to add to the batch
+parser.add_argument('-w', '--workers', type=int, default=1)  # simulations running in parallel, one process each
+parser.add_argument('--resample-objects', action='store_true')  # rebuild the model between runs of one simulation
+parser.add_argument('--model-cache-dir', nargs='?', const=str(cur_dir / "ModelCache"), default=None)
+parser.add_argument('--render-size', type=int, nargs=2, default=[1280, 720], metavar=('WIDTH', 'HEIGHT'))
+# frames sent to the LLM are cropped and scaled down to this size, the log keeps the rendered resolution
+parser.add_argument('--llm-image-size', type=int, nargs=2, default=None, metavar=('WIDTH', 'HEIGHT'))
+parser.add_argument('--llm-image-crop', type=int, nargs=4, default=None, metavar=('LEFT', 'UPPER', 'RIGHT', 'LOWER'))
+parser.add_argument('--image-detail', choices=['auto', 'low', 'high'], default='auto')
+# shrinks the conversation before each request: only the latest image, shortened old tool results, token cap
+parser.add_argument('--compaction', choices=['none', 'truncate'], default='none')
+parser.add_argument('--keep-tool-results', type=int, default=2)  # tool results that are never shortened
+parser.add_argument('--max-prompt-tokens', type=int, default=None)
+# stable prefix first (system prompt, tools, task text, then the scene) with cache breakpoints, logs cached tokens
+parser.add_argument('--prompt-caching', action='store_true')
+# record: reuse cached responses and store new ones, replay: only cached responses, no network
+parser.add_argument('--response-cache', choices=['off', 'record', 'replay'], default='off')
+parser.add_argument('--response-cache-dir', default=None)  # defaults to Logs/<batch>/ResponseCache
+# scripted: offline stand-in that executes the canonical plan, for throughput measurements without network
+parser.add_argument('--backend', choices=['litellm', 'scripted'], default='litellm')
+parser.add_argument('--scripted-latency', type=float, default=0.0)  # seconds the scripted backend waits per response
+# per model, shared by all runs of this process but not with other processes, concurrent main.py processes of the
+# same account need a share of the provider limit each, 429 and 5xx errors are retried with exponential backoff
+parser.add_argument('--requests-per-minute', type=float, default=None)
+parser.add_argument('--tokens-per-minute', type=float, default=None)
+parser.add_argument('--max-retries', type=int, default=6)
+parser.add_argument('--async', dest='use_async', action='store_true')  # interleave the runs in one event loop
+parser.add_argument('-c', '--concurrency', type=int, default=4)  # maximum number of concurrent runs with --async
+
+
+def create_log_path(batch_path: Path) -> Path:
+    """registers the next run in the index of the batch and creates its directory"""
+    return BatchIndex(batch_path).allocate_run()
+
+
+def run_single(args, batch_path: Path) -> None:
+    headless = not args.renderer
+    controller = Controller(headless=headless, synchronous=args.synchronous, seed=args.seed,
+                            model_cache_dir=args.model_cache_dir, render_size=args.render_size)
+    Episode(args, controller, create_log_path(batch_path)).run()
+
+
+def run_batch(args, batch_path: Path) -> None:
+    """runs args.num_runs episodes, args.workers of them concurrently on a pool of simulation processes"""
+    if args.renderer:
+        raise ValueError("the renderer is only available for a single run with one worker")
+    with ControllerPool(args.workers, headless=True, synchronous=args.synchronous,
+                        model_cache_dir=args.model_cache_dir, render_size=args.render_size) as pool:
+        free_controllers = Queue()
+        for controller in pool:
+            free_controllers.put(controller)
+
+        def run_episode(run_number: int) -> None:
+            controller = free_controllers.get()
+            try:
+                controller.reset_episode(seed=None if args.seed is None else args.seed + run_number,
+                                         resample_objects=args.resample_objects)
+                Episode(args, controller, create_log_path(batch_path)).run()
+            finally:
+                free_controllers.put(controller)
+
+        with ThreadPoolExecutor(max_workers=len(pool)) as executor:
+            list(executor.map(run_episode, range(args.num_runs)))
+
+
+async def run_batch_async(args, batch_path: Path) -> None:
+    """runs args.num_runs episodes in one event loop, at most args.concurrency of them at the same time, while one
+    episode waits for the model the others execute their primitives"""
+    if args.renderer:
+        raise ValueError("the renderer is only available for a single run with one worker")
+    # every running episode blocks at most one thread at a time
+    asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(max_workers=args.concurrency))
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    loop = asyncio.get_running_loop()
+    pool = ControllerPool(args.workers, headless=True, synchronous=args.synchronous,
+                          model_cache_dir=args.model_cache_dir,
+                          render_size=args.render_size) if args.workers > 1 else None
+    # controllers are reused by the following runs, without a pool they are created in this process on demand, each
+    # with a thread of its own that makes every call of it, the renderer of a controller only works from one thread
+    free_controllers = asyncio.Queue()
+    for controller in pool or []:
+        free_controllers.put_nowait((controller, None))
+    controller_threads = []
+
+    async def run_episode(run_number: int) -> None:
+        seed = None if args.seed is None else args.seed + run_number
+        async with semaphore:
+            if pool is None and free_controllers.empty():
+                executor = ThreadPoolExecutor(max_workers=1)
+                controller_threads.append(executor)
+                controller = await loop.run_in_executor(executor, partial(
+                    Controller, headless=True, synchronous=args.synchronous, seed=seed,
+                    model_cache_dir=args.model_cache_dir, render_size=args.render_size
+                ))
             else:
-                reasoning = {"reasoning_effort": "medium"}
-        else:
-            reasoning = dict()
-        response = litellm.completion(
-            model=args.model,
-            messages=messages,
-            tools=tools if activate_tools else None,
-            **reasoning
-        )
-        response_count += 1
-        # response.usage contains tokens
-        logger.info(f"\nLLM Response:\n{response.choices[0].message.content}")
-        response_message = response.choices[0].message
-        tool_calls = response_message.tool_calls
-
-        # Note: the JSON response may not always be valid; be sure to handle errors
-        messages.append(response_message)  # extend conversation with assistant's reply
-
-        # Step 2: check if the model wanted to call a function
-        if tool_calls:
-            logger.info("LLM wants to execute tool calls")
-            logger.info("\nTool calls:")
-            for n, tool_call in enumerate(tool_calls[:]):  # create a copy of tool_calls
-                name = tool_call.function.name
-                f_args = json.loads(tool_call.function.arguments)
-                color = "\033[36m"
-                reset = "\033[0m"
-                logger.info(f"{color + 'Will not be executed: ' if n > 0 else ''}"
-                            f"{name}({', '.join([f'{arg}={val}' for arg, val in f_args.items()])}){reset if n > 0 else ''}")
-                if n > 0:
-                    tool_calls.pop()  # pop one element for each element after the first one
-
-            # Step 3: call the function
-
-            # Step 4: send the info for each function call and function response to the model
-            tool_call = tool_calls[0]
-            function_name = tool_call.function.name
-            function_to_call = available_functions[function_name]
-            function_args = json.loads(tool_call.function.arguments)
-            function_response = function_to_call(**function_args)
-            messages.append(
-                {
-                    "tool_call_id": tool_call.id,
-                    "role": "tool",
-                    "name": function_name,
-                    "content": str(function_response),
-                }
-            )  # extend conversation with function response
+                controller, executor = await free_controllers.get()
+                await loop.run_in_executor(executor, controller.reset_episode, seed, args.resample_objects)
+            try:
+                await Episode(args, controller, create_log_path(batch_path)).run_async(executor)
+            finally:
+                free_controllers.put_nowait((controller, executor))
+
+    try:
+        await asyncio.gather(*(run_episode(run_number) for run_number in range(args.num_runs)))
+    finally:
+        if pool is not None:
+            pool.close()
+        for executor in controller_threads:
+            executor.shutdown()
+
+
+def main():
+    args = parser.parse_args()
+
+    # not needed with the scripted backend or a replayed cache, the key may also be set in the environment already
+    if (cur_dir / "API_KEY").exists():
+        environ["OPENAI_API_KEY"] = open(cur_dir / "API_KEY", mode="r").read()
+
+    if args.stream and args.response_cache != "off":
+        raise ValueError("streamed responses can not be cached")
+
+    batch_name = args.batch_name  # leave empty to save in Logs directly
+    batch_path = logs_dir / batch_name
+    batch_path.mkdir(parents=True, exist_ok=True)
+
+    if args.use_async:
+        asyncio.run(run_batch_async(args, batch_path))
+    elif args.num_runs == 1 and args.workers == 1:
+        run_single(args, batch_path)
+    else:
+        run_batch(args, batch_path)
 
-            used_tool_calls.append(tool_call)
 
-            if vision_legacy or vision_enabled or args.log_pictures:
-                image = image_logger.get_image()
-                if vision_send_every_tool_call:
-                    message = {"role": "user", "content": [
-                        {
-                            "type": "text",
-                            "text": "This is the current scene, you may continue the task according to the situation "
-                                    "after checking if everything is correct and telling me if the last action was "
-                                    "successful."
-                        }
-                    ]}
-                    image_logger.add_image_to_message(message, image)
-                    if last_image_index is None:
-                        messages[1]["content"].pop()
-                    else:
-                        messages.pop(last_image_index)
-                    last_image_index = len(messages)
-                    messages.append(message)
-        else:
-            logger.info("LLM is reasoning")
-            logger.info(f"\nLLM Reasoning:\n{response.choices[0].message.content}")
-            activate_tools = True
-except Exception as e:
-    logger.error(f"Execution failed and yielded following error:\n{e}")
-    logger.info("ERROR")
-    error_state = True
-finally:
-    if error_state:
-        pass
-    elif controller.check_successful():
-        logger.info("Task accomplished successfully!")
-        logger.info("SUCCESS")
-    else:
-        logger.info("Task failed after fifteen messages...\n"
-                    "Current State:\n"
-                    f"Object inside the microwave: {controller.check_object_in_microwave()}\n"
-                    f"Microwave button was pressed: {controller.check_button_pressed()}\n"
-                    f"Gripper is at least 25cm away from the door: {controller.check_gripper_away_from_microwave()}\n")
-        logger.info("Manually check if the procedure was correct:")
-        for tool_call in used_tool_calls:
-            name = tool_call.function.name
-            args = json.loads(tool_call.function.arguments)
-            logger.info(f"{name}({', '.join([f'{arg}={val}' for arg, val in args.items()])})")
-        logger.info("FAIL")
-    controller.stop()
+if __name__ == "__main__":
+    main()
@@ -1,80 +1,16 @@
-from operator import itemgetter
-
 import matplotlib.pyplot as plt
 import numpy as np
-import pandas as pd
-
-
-def decode_simulation(name: str) -> dict:
-    """Decode a simulation name into structured parts and human-readable text."""
-
-    # Flags
-    is_reasoning = name.endswith("_reasoning")
-    has_picture_call = "picture_every_tool_call" in name
-
-    # Remove reasoning / picture tokens to isolate base
-    base = name.replace("_reasoning", "")
-    base = base.replace("_picture_every_tool_call", "")
-
-    # Vision type
-    if base.startswith("json_vision"):
-        vision_type = "JSON scene desc."
-        rest = base.replace("json_vision_", "")
-    elif base.startswith("no_vision"):
-        vision_type = "no vision"
-        rest = base.replace("no_vision_", "")
-    elif base.startswith("vision_legacy"):
-        vision_type = "image"
-        rest = base.replace("vision_legacy_", "")
-    elif base.startswith("vision"):
-        vision_type = "scene desc."
-        rest = base.replace("vision_", "")
-    else:
-        vision_type = "unknown"
-        rest = base
-
-    # Model name cleanup
-    model_name = rest.replace("_", "")
-
-    # Human-readable parts
-    description = vision_type
-    if has_picture_call:
-        description += " every tc"
-    description += ", " + model_name
-    if is_reasoning:
-        description += " + r"
-
-    def description_creator(omit_reasoning=False, omit_model=False):
-        description_ = vision_type
-        if has_picture_call:
-            description_ += " + image every tool call"
-        description_ += ", " + model_name if not omit_model else ""
-        if is_reasoning and not omit_reasoning:
-            description_ += " + reasoning"
-        return description_
-
-    return {
-        "raw": name,
-        "vision_type": vision_type,
-        "model": model_name,
-        "reasoning": is_reasoning,
-        "picture_every_tool_call": has_picture_call,
-        "human_readable": description,
-        "description": description_creator
-    }
-
 
-df = pd.read_csv("results_raw.csv")
+from Code.LiteLLM.results_store import CONFIG_COLUMNS, OUTCOMES, describe, load_results, outcome_counts
 
-# first sort the variations by every variable that can change, TODO last by those who are split by
-df.sort_index(
-    axis=1,
-    key=lambda cols: cols.map(lambda c: itemgetter("model", "vision_type", "reasoning")(decode_simulation(c))),
-    inplace=True
-)
+# one column per configuration, already sorted by model, vision type and reasoning, one row per outcome
+counts = outcome_counts(load_results())
+df = counts.T
+df.index = [f"{label};{color}" for _, label, color in OUTCOMES]
+df.columns = range(len(counts))
 
 categories = df.columns
-decoded_categories = [decode_simulation(category) for category in categories]
+decoded_categories = [dict(zip(CONFIG_COLUMNS, config)) for config in counts.index]
 
 # split_by = {"reasoning"}
 split_by = []
@@ -85,7 +21,8 @@ for split_category in split_by:
         unique_values.add(category[split_category])
     num_subplots *= len(unique_values)
 
-# try finding entries with only categories from split_by mismatched (the method relies on the sorting TODO above)
+# try finding entries with only categories from split_by mismatched (the method relies on outcome_counts
+# sorting the configurations by model, vision type and reasoning)
 for i, decoded in enumerate(decoded_categories):
     # if i != len(decoded_categories)-1:
     # if all([decoded[cat] == decoded_categories[i+1][cat] for
@@ -97,10 +34,10 @@ fig, axes = plt.subplots(1, num_subplots, figsize=(8*num_subplots, 5))
 
 
 x = np.arange(len(categories))
-col_sum = [df[column["raw"]].sum() for column in decoded_categories]
+col_sum = [df[column].sum() for column in categories]
 remaining_col_sum = col_sum[:]
 
-decoded_names = [category["human_readable"] for category in decoded_categories]
+decoded_names = [describe(category, short=True) for category in decoded_categories]
 # Plotting segmented (stacked) bars
 for label, row in df.iterrows():
     split_label = str(label).split(";")
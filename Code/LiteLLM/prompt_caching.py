@@ -0,0 +1,37 @@
+from typing import Optional, Tuple
+
+import litellm
+
+# providers that only cache up to explicit cache_control breakpoints, the others (e.g. OpenAI) cache the longest
+# common prefix of the request automatically and would reject the unknown field
+BREAKPOINT_PROVIDERS = {"anthropic", "bedrock", "vertex_ai"}
+
+
+def needs_cache_breakpoints(model: str) -> bool:
+    try:
+        _, provider, _, _ = litellm.get_llm_provider(model)
+    except Exception:
+        return False
+    return provider in BREAKPOINT_PROVIDERS
+
+
+def mark_cache_breakpoint(message: dict) -> dict:
+    """the provider caches the request up to and including the last content part of this message"""
+    if isinstance(message["content"], str):
+        message["content"] = [{"type": "text", "text": message["content"]}]
+    message["content"][-1]["cache_control"] = {"type": "ephemeral"}
+    return message
+
+
+def get_cached_tokens(usage) -> Tuple[int, int, Optional[int]]:
+    """returns (prompt tokens, tokens read from the cache, tokens written to the cache) of a response, the latter is
+    only reported by providers with explicit breakpoints"""
+    if usage is None:
+        return 0, 0, None
+    prompt_tokens = getattr(usage, "prompt_tokens", 0) or 0
+    details = getattr(usage, "prompt_tokens_details", None)
+    cached_tokens = getattr(details, "cached_tokens", None) if details is not None else None
+    if cached_tokens is None:
+        cached_tokens = getattr(usage, "cache_read_input_tokens", 0) or 0
+    cache_creation_tokens = getattr(usage, "cache_creation_input_tokens", None)
+    return prompt_tokens, cached_tokens, cache_creation_tokens
@@ -0,0 +1,43 @@
+import litellm
+import pandas as pd
+
+from Code.LiteLLM.results_store import CONFIG_COLUMNS, describe, load_results, model_results
+
+results = model_results(load_results())
+# runs older than the run trace have no timing or token data
+results = results[results["duration_seconds"].notna()].copy()
+
+
+def run_cost(run: pd.Series) -> float:
+    try:
+        prompt_cost, completion_cost = litellm.cost_per_token(model=run["model"],
+                                                              prompt_tokens=int(run["prompt_tokens"]),
+                                                              completion_tokens=int(run["completion_tokens"]))
+    except Exception:  # model without known prices
+        return float("nan")
+    return prompt_cost + completion_cost
+
+
+results["cost"] = results.apply(run_cost, axis=1)
+results["success"] = results["outcome"] == "SUCCESS"
+
+grouped = results.groupby(CONFIG_COLUMNS)
+report = pd.DataFrame({
+    "runs": grouped.size(),
+    "success rate": grouped["success"].mean(),
+    "turns": grouped["responses"].mean(),
+    "duration [s]": grouped["duration_seconds"].mean(),
+    "median duration [s]": grouped["duration_seconds"].median(),
+    "LLM [s]": grouped["llm_seconds"].mean(),
+    "tools [s]": grouped["tool_seconds"].mean(),
+    "prompt tokens": grouped["prompt_tokens"].mean(),
+    "completion tokens": grouped["completion_tokens"].mean(),
+    "cost per run [$]": grouped["cost"].mean(),
+    "cost per success [$]": grouped["cost"].sum() / grouped["success"].sum(),
+})
+report.index = [describe(dict(zip(CONFIG_COLUMNS, config)), short=True) for config in report.index]
+
+print(report.to_string(float_format=lambda value: f"{value:.3f}"))
+report.to_csv("latency_cost_report.csv")
+with open("latency_cost_report.tex", "w") as f:
+    f.write(report.to_latex(float_format="%.3f", escape=False))
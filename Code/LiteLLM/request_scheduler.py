@@ -0,0 +1,170 @@
+import asyncio
+from email.utils import parsedate_to_datetime
+import logging
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Optional
+
+import litellm
+
+from Code.LiteLLM.compaction import count_tokens
+
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504, 529}
+RETRYABLE_EXCEPTIONS = (litellm.RateLimitError, litellm.ServiceUnavailableError, litellm.InternalServerError,
+                        litellm.APIConnectionError, litellm.Timeout)
+
+
+class TokenBucket:
+    """refills with per_minute units per minute up to per_minute, callers reserve units and wait until the bucket
+    covers them, the bucket may go negative, so waiting callers are served in the order they reserved"""
+
+    def __init__(self, per_minute: float):
+        self.rate = per_minute / 60
+        self.capacity = per_minute
+        self.tokens = per_minute
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def reserve(self, amount: float) -> float:
+        """takes the amount from the bucket and returns the seconds until it is covered"""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= amount
+            return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def acquire(self, amount: float = 1) -> None:
+        time.sleep(self.reserve(amount))
+
+    async def acquire_async(self, amount: float = 1) -> None:
+        await asyncio.sleep(self.reserve(amount))
+
+
+# shared by every scheduler of the process, concurrent episodes of the same model draw from the same buckets, other
+# processes have their own buckets, the limits are per process
+_buckets = {}
+_buckets_lock = threading.Lock()
+
+
+def get_bucket(model: str, kind: str, per_minute: Optional[float]) -> Optional[TokenBucket]:
+    if per_minute is None:
+        return None
+    with _buckets_lock:
+        if (model, kind) not in _buckets:
+            _buckets[(model, kind)] = TokenBucket(per_minute)
+        elif _buckets[(model, kind)].capacity != per_minute:
+            raise ValueError(f"{model} already has a limit of {_buckets[(model, kind)].capacity} {kind} per minute in "
+                             f"this process, got {per_minute}")
+        return _buckets[(model, kind)]
+
+
+def is_retryable(e: Exception) -> bool:
+    return isinstance(e, RETRYABLE_EXCEPTIONS) or getattr(e, "status_code", None) in RETRYABLE_STATUS_CODES
+
+
+def get_retry_after(e: Exception) -> Optional[float]:
+    """seconds the provider asked to wait, from the retry-after header of the error response"""
+    response = getattr(e, "response", None)
+    headers = getattr(response, "headers", None) or getattr(e, "litellm_response_headers", None) or {}
+    value = headers.get("retry-after-ms")
+    if value is not None:
+        try:
+            return float(value) / 1000
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        return max((parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+class RequestScheduler:
+    """wraps the completion functions of a backend:
+    - requests and prompt tokens per minute are limited per model with token buckets shared by the whole process,
+      the limits are per process, processes running at the same time each need their share of the provider limit
+    - 429 and 5xx errors are retried with exponential backoff and full jitter, a retry-after of the provider is
+      honoured, the error is only raised after max_retries retries
+    """
+
+    def __init__(self, completion=litellm.completion, acompletion=litellm.acompletion,
+                 requests_per_minute: Optional[float] = None, tokens_per_minute: Optional[float] = None,
+                 max_retries: int = 6, base_delay: float = 1.0, max_delay: float = 60.0,
+                 logger: Optional[logging.Logger] = None):
+        self._completion = completion
+        self._acompletion = acompletion
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.logger = logger
+        self.retries = 0
+
+    def _reservations(self, kwargs: dict) -> list:
+        """buckets of the model and the amounts a request takes from them"""
+        model = kwargs.get("model")
+        reservations = []
+        request_bucket = get_bucket(model, "requests", self.requests_per_minute)
+        if request_bucket is not None:
+            reservations.append((request_bucket, 1))
+        token_bucket = get_bucket(model, "tokens", self.tokens_per_minute)
+        if token_bucket is not None:
+            reservations.append((token_bucket, count_tokens(model, kwargs.get("messages", []))))
+        return reservations
+
+    def _record_usage(self, kwargs: dict, response) -> None:
+        # the completion tokens are only known afterwards, they are taken without waiting
+        token_bucket = get_bucket(kwargs.get("model"), "tokens", self.tokens_per_minute)
+        usage = getattr(response, "usage", None)
+        if token_bucket is not None and usage is not None:
+            token_bucket.reserve(getattr(usage, "completion_tokens", 0) or 0)
+
+    def _backoff(self, attempt: int, e: Exception) -> float:
+        if attempt >= self.max_retries or not is_retryable(e):
+            raise e
+        delay = get_retry_after(e)
+        if delay is None:
+            delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        self.retries += 1
+        if self.logger is not None:
+            self.logger.info(f"Request failed with {e.__class__.__name__}, retry {attempt + 1} of "
+                             f"{self.max_retries} in {delay:.1f}s")
+        return delay
+
+    def completion(self, **kwargs):
+        for attempt in range(self.max_retries + 1):
+            for bucket, amount in self._reservations(kwargs):
+                bucket.acquire(amount)
+            try:
+                response = self._completion(**kwargs)
+            except Exception as e:
+                time.sleep(self._backoff(attempt, e))
+            else:
+                self._record_usage(kwargs, response)
+                return response
+
+    async def acompletion(self, **kwargs):
+        for attempt in range(self.max_retries + 1):
+            for bucket, amount in self._reservations(kwargs):
+                await bucket.acquire_async(amount)
+            try:
+                response = await self._acompletion(**kwargs)
+            except Exception as e:
+                await asyncio.sleep(self._backoff(attempt, e))
+            else:
+                self._record_usage(kwargs, response)
+                return response
+
+
+# retries only, for callers without their own scheduler
+default_scheduler = RequestScheduler()
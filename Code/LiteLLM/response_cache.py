@@ -0,0 +1,76 @@
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import Union
+
+import litellm
+
+from Code.LiteLLM.compaction import as_dict
+
+
+class ResponseCache:
+    """content-addressed cache around litellm.completion, every response is stored as JSON named after the hash of
+    the request (model, messages, tools, reasoning parameters, ...)
+    - record: cached responses are reused, everything else is requested from the model and stored
+    - replay: only cached responses are returned, a request that was never recorded raises a KeyError
+    the rendered images are part of the messages, runs only hit the cache if they render the same frames, i.e. with
+    --synchronous and a fixed --seed
+    """
+
+    modes = ("record", "replay")
+
+    def __init__(self, directory: Union[str, Path], mode: str = "record", completion=litellm.completion,
+                 acompletion=litellm.acompletion):
+        if mode not in self.modes:
+            raise ValueError(f"unknown response cache mode {mode}")
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.mode = mode
+        self._completion = completion
+        self._acompletion = acompletion
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def get_key(**kwargs) -> str:
+        request = {**kwargs, "messages": [as_dict(message) for message in kwargs.get("messages", [])]}
+        encoded = json.dumps(request, sort_keys=True, default=str)
+        return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> Path:
+        return self.directory / f"{key}.json"
+
+    def _load(self, key: str):
+        path = self._path(key)
+        if not path.exists():
+            if self.mode == "replay":
+                raise KeyError(f"no recorded response for request {key} in {self.directory}")
+            self.misses += 1
+            return None
+        self.hits += 1
+        with open(path, mode="r") as response_file:
+            return litellm.ModelResponse(**json.load(response_file))
+
+    def _store(self, key: str, response) -> None:
+        # concurrent runs may record the same request, the file is only visible once it is complete
+        temporary_path = self._path(key).with_suffix(f".{os.getpid()}.{id(response)}.tmp")
+        with open(temporary_path, mode="w") as response_file:
+            json.dump(response.model_dump(), response_file, default=str)
+        os.replace(temporary_path, self._path(key))
+
+    def completion(self, **kwargs):
+        key = self.get_key(**kwargs)
+        response = self._load(key)
+        if response is None:
+            response = self._completion(**kwargs)
+            self._store(key, response)
+        return response
+
+    async def acompletion(self, **kwargs):
+        key = self.get_key(**kwargs)
+        response = self._load(key)
+        if response is None:
+            response = await self._acompletion(**kwargs)
+            self._store(key, response)
+        return response
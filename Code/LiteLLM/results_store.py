@@ -0,0 +1,162 @@
+import json
+from pathlib import Path
+from typing import List, Optional, Union
+
+import pandas as pd
+
+from Code.LiteLLM.batch_index import BatchIndex, RUN_PREFIX
+
+cur_dir = Path(__file__).parent
+logs_dir = cur_dir / "Logs"
+RESULTS_STORE_PATH = cur_dir / "results.parquet"
+
+# configuration of a run, taken from its args.json, runs are only counted together if all of them match
+CONFIG_COLUMNS = ["model", "vision_type", "reasoning", "send_every_tool_call", "functions", "agent_mode", "compaction",
+                  "prompt_caching"]
+SUMMARY_COLUMNS = ["responses", "llm_calls", "tool_calls", "prompt_tokens", "completion_tokens", "llm_seconds",
+                   "tool_seconds", "duration_seconds", "object_in_microwave", "button_pressed",
+                   "gripper_away_from_microwave"]
+# outcome, label and color in the reports
+OUTCOMES = [("SUCCESS", "Passes", "green"), ("FAIL", "Fails", "red"), ("ERROR", "Errors", "orange"),
+            ("UNKNOWN", "Timeouts", "gray")]
+
+
+def get_vision_type(args: dict) -> str:
+    if args.get("vision_legacy"):
+        return "image"
+    if args.get("vision_enabled"):
+        return "JSON scene desc." if args.get("use_json") else "scene desc."
+    return "no vision"
+
+
+def get_functions(args: dict) -> str:
+    if args.get("use_all_functions"):
+        return "all"
+    if args.get("use_low_level_only"):
+        return "low level"
+    return "high level"
+
+
+def get_agent_mode(args: dict) -> str:
+    if args.get("plan_execute"):
+        return "plan"
+    if args.get("batch_tool_calls"):
+        return "batch"
+    return "single"
+
+
+def read_args(log_path: Path) -> dict:
+    try:
+        with open(log_path / "args.json", mode="r") as args_file:
+            return json.load(args_file)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+COLUMNS = ["batch", "run_index", "seq", "backend", *CONFIG_COLUMNS, "outcome", *SUMMARY_COLUMNS, "args"]
+
+
+def run_row(batch_path: Path, run_index: int, seq: Optional[int], outcome: str, summary: Optional[dict]) -> dict:
+    args = read_args(batch_path / f"{RUN_PREFIX}{run_index}")
+    summary = summary or {}
+    return {
+        "batch": batch_path.name,
+        "run_index": run_index,
+        # position of the result in the batch index, None for runs without a result
+        "seq": seq,
+        # runs of the scripted backend are throughput measurements, not results of the model
+        "backend": args.get("backend", "litellm"),
+        "model": args.get("model"),
+        "vision_type": get_vision_type(args),
+        "reasoning": bool(args.get("use_reasoning")),
+        # -s only sends an image after every tool call together with --vision-legacy
+        "send_every_tool_call": bool(args.get("vision_legacy") and args.get("send_every_tool_call")),
+        "functions": get_functions(args),
+        "agent_mode": get_agent_mode(args),
+        "compaction": args.get("compaction", "none"),
+        "prompt_caching": bool(args.get("prompt_caching")),
+        "outcome": outcome,
+        **{column: summary.get(column) for column in SUMMARY_COLUMNS},
+        # every other setting of the run, e.g. for filtering by backend or compaction
+        "args": json.dumps(args),
+    }
+
+
+def batch_rows(batch_path: Path, seq: int = 0) -> List[dict]:
+    """rows of the results added after seq and of the runs that have no result yet"""
+    index = BatchIndex(batch_path)
+    rows = [run_row(batch_path, run_index, new_seq, outcome, summary)
+            for new_seq, run_index, outcome, summary in index.results_since(seq)]
+    rows += [run_row(batch_path, run_index, None, "UNKNOWN", None) for run_index in index.unfinished_runs()]
+    return rows
+
+
+def build_results_store(logs_path: Union[str, Path] = logs_dir, path: Union[str, Path] = RESULTS_STORE_PATH,
+                        rebuild: bool = False) -> pd.DataFrame:
+    """one row per run of every batch in the Logs directory in a Parquet file, the rows of finished runs are kept and
+    only the results after the last seq of each batch are appended, runs without a result are read again"""
+    batch_paths = [batch_path for batch_path in sorted(Path(logs_path).iterdir())
+                   if batch_path.is_dir() and "_" in batch_path.name]
+    stored = None
+    if not rebuild and Path(path).exists():
+        stored = pd.read_parquet(path)
+        if list(stored.columns) != COLUMNS:
+            stored = None  # written by an older version with other columns
+    if stored is not None:
+        stored = stored[stored["seq"].notna() & stored["batch"].isin([batch_path.name for batch_path in batch_paths])]
+        cursors = stored.groupby("batch")["seq"].max().to_dict()
+    else:
+        cursors = {}
+    rows = []
+    for batch_path in batch_paths:
+        rows.extend(batch_rows(batch_path, int(cursors.get(batch_path.name, 0))))
+    results = pd.DataFrame(rows, columns=COLUMNS).astype({"seq": "Int64"})
+    if stored is not None:
+        results = pd.concat([stored, results], ignore_index=True)
+    results = results.sort_values(["batch", "run_index"], ignore_index=True)
+    results.to_parquet(path, index=False)
+    return results
+
+
+def load_results(path: Union[str, Path] = RESULTS_STORE_PATH) -> pd.DataFrame:
+    if not Path(path).exists():
+        return build_results_store(path=path)
+    return pd.read_parquet(path)
+
+
+def model_results(results: pd.DataFrame) -> pd.DataFrame:
+    """the runs that were answered by a model, without the scripted throughput runs"""
+    return results[results["backend"] == "litellm"]
+
+
+def outcome_counts(results: pd.DataFrame, by: List[str] = CONFIG_COLUMNS) -> pd.DataFrame:
+    """number of passes, fails, errors and timeouts per configuration of the model runs, one row per configuration"""
+    counts = model_results(results).groupby(by + ["outcome"], dropna=False).size().unstack("outcome", fill_value=0)
+    return counts.reindex(columns=[outcome for outcome, _, _ in OUTCOMES], fill_value=0) \
+        .rename(columns={outcome: label for outcome, label, _ in OUTCOMES})
+
+
+def describe(config: dict, omit_reasoning=False, omit_model=False, short=False) -> str:
+    """human-readable name of a configuration"""
+    description = config["vision_type"]
+    if config["send_every_tool_call"]:
+        description += " every tc" if short else " + image every tool call"
+    if not omit_model:
+        description += ", " + config["model"]
+    if config["reasoning"] and not omit_reasoning:
+        description += " + r" if short else " + reasoning"
+    return description + describe_settings(config, short)
+
+
+def describe_settings(config: dict, short=False) -> str:
+    """the settings of a configuration that differ from the default, empty for the default"""
+    description = ""
+    if config["functions"] != "high level":
+        description += f" + {config['functions']} functions"
+    if config["agent_mode"] != "single":
+        description += f" + {config['agent_mode']}" if short else f" + {config['agent_mode']} tool calls"
+    if config["compaction"] != "none":
+        description += f" + {config['compaction']}" if short else f" + {config['compaction']} compaction"
+    if config["prompt_caching"]:
+        description += " + pc" if short else " + prompt caching"
+    return description
@@ -0,0 +1,98 @@
+import json
+import threading
+import time
+from pathlib import Path
+from typing import Optional, Union
+
+TRACE_FILE = "trace.jsonl"
+SUMMARY_FILE = "summary.json"
+
+
+def get_usage(response) -> dict:
+    usage = getattr(response, "usage", None)
+    if usage is None:
+        return {"prompt_tokens": 0, "completion_tokens": 0}
+    return {"prompt_tokens": getattr(usage, "prompt_tokens", 0) or 0,
+            "completion_tokens": getattr(usage, "completion_tokens", 0) or 0}
+
+
+class RunTrace:
+    """structured events of one run, one JSON object per line in trace.jsonl, and a fixed-size summary.json that is
+    written together with the outcome
+    - llm_call: purpose, latency and token usage of every model request
+    - tool_call: name, arguments, duration and result or error of every executed function
+    - outcome: SUCCESS, FAIL or ERROR and the state of the check_* functions
+    """
+
+    def __init__(self, log_path: Union[str, Path]):
+        self.log_path = Path(log_path)
+        self.start = time.perf_counter()
+        # tool calls started while a response is streamed are traced from the dispatcher thread
+        self.lock = threading.Lock()
+        self.trace_file = open(self.log_path / TRACE_FILE, mode="w", buffering=1)
+        self.llm_calls = 0
+        self.tool_calls = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.llm_seconds = 0.0
+        self.tool_seconds = 0.0
+
+    def event(self, event_type: str, **fields) -> None:
+        with self.lock:
+            if self.trace_file.closed:
+                return
+            self.trace_file.write(json.dumps(
+                {"event": event_type, "time": round(time.perf_counter() - self.start, 4), **fields}, default=str
+            ) + "\n")
+
+    def llm_call(self, purpose: str, latency: float, response) -> None:
+        usage = get_usage(response)
+        with self.lock:
+            self.llm_calls += 1
+            self.llm_seconds += latency
+            self.prompt_tokens += usage["prompt_tokens"]
+            self.completion_tokens += usage["completion_tokens"]
+        self.event("llm_call", purpose=purpose, latency=round(latency, 4), **usage)
+
+    def tool_call(self, name: str, arguments: dict, duration: float, result=None,
+                  error: Optional[Exception] = None) -> None:
+        with self.lock:
+            self.tool_calls += 1
+            self.tool_seconds += duration
+        self.event("tool_call", name=name, arguments=arguments, duration=round(duration, 4),
+                   result=None if error is not None else str(result),
+                   error=None if error is None else f"{error.__class__.__name__}: {error}")
+
+    def outcome(self, outcome: str, state: dict, responses: int) -> dict:
+        """records the outcome and writes the summary, closes the trace"""
+        duration = time.perf_counter() - self.start
+        self.event("outcome", outcome=outcome, **state)
+        summary = {
+            "outcome": outcome,
+            "responses": responses,
+            "llm_calls": self.llm_calls,
+            "tool_calls": self.tool_calls,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "llm_seconds": round(self.llm_seconds, 4),
+            "tool_seconds": round(self.tool_seconds, 4),
+            "duration_seconds": round(duration, 4),
+            **state,
+        }
+        with open(self.log_path / SUMMARY_FILE, mode="w") as summary_file:
+            json.dump(summary, summary_file)
+        self.close()
+        return summary
+
+    def close(self) -> None:
+        with self.lock:
+            self.trace_file.close()
+
+
+def read_summary(log_path: Union[str, Path]) -> Optional[dict]:
+    """the summary of a finished run, None for runs that were interrupted or are older than the trace"""
+    try:
+        with open(Path(log_path) / SUMMARY_FILE, mode="r") as summary_file:
+            return json.load(summary_file)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
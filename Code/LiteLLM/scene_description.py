@@ -1,12 +1,12 @@
-import litellm
 from typing import Union
 
 from PIL.Image import Image
 
-from Code.LiteLLM.image_logger import ImageLogger
+from Code.LiteLLM.image_logger import ImageLogger, EncodedImage
+from Code.LiteLLM.request_scheduler import default_scheduler
 
 
-def get_scene_description(image_logger: ImageLogger, model: str):
+def get_scene_description(image_logger: ImageLogger, model: str, completion=default_scheduler.completion):
     system_prompt = {"role": "system",
                      "content": "You are a chatbot that is meant to give scene descriptions with a given "
                                 "image. You should describe the image provided in "
@@ -26,7 +26,7 @@ def get_scene_description(image_logger: ImageLogger, model: str):
 
     image_logger.add_current_scene_to_message(user_prompt)
 
-    response = litellm.completion(
+    response = completion(
         model=model,
         messages=messages,
         tools=None,
@@ -35,7 +35,7 @@ def get_scene_description(image_logger: ImageLogger, model: str):
     return response.choices[0].message.content
 
 
-def get_scene_description_json(image_logger: ImageLogger, model: str):
+def get_scene_description_json(image_logger: ImageLogger, model: str, completion=default_scheduler.completion):
     system_prompt = {"role": "system",
                      "content": "You are a chatbot that is meant to give scene descriptions in JSON with a given "
                                 "image. You should list all objects that can be seen, where they are, how "
@@ -54,7 +54,7 @@ def get_scene_description_json(image_logger: ImageLogger, model: str):
 
     image_logger.add_current_scene_to_message(user_prompt)
 
-    response = litellm.completion(
+    response = completion(
         model=model,
         messages=messages,
         tools=None,
@@ -63,9 +63,10 @@ def get_scene_description_json(image_logger: ImageLogger, model: str):
     return response.choices[0].message.content
 
 
-def get_scene_diff(image_logger: ImageLogger, previous_scene: Union[Image, str], model: str, mode="auto"):
+def get_scene_diff(image_logger: ImageLogger, previous_scene: Union[EncodedImage, Image, str], model: str,
+                   mode="auto", completion=default_scheduler.completion):
     if mode == "auto":
-        if isinstance(previous_scene, Image):
+        if isinstance(previous_scene, (EncodedImage, Image)):
             mode = "image"
         elif isinstance(previous_scene, str):
             mode = "json"
@@ -95,12 +96,12 @@ def get_scene_diff(image_logger: ImageLogger, previous_scene: Union[Image, str],
     if mode == "json":
         user_prompt["content"][0]["text"] += f"\n{previous_scene}"
     elif mode == "image":
-        ImageLogger.add_image_to_message(user_prompt, previous_scene)
+        image_logger.add_llm_image_to_message(user_prompt, previous_scene)
     image_logger.add_current_scene_to_message(user_prompt)
 
     messages = [system_prompt, user_prompt]
 
-    response = litellm.completion(
+    response = completion(
         model=model,
         messages=messages,
         tools=None,
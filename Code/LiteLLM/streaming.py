@@ -0,0 +1,40 @@
+import json
+from typing import List, Optional, Tuple
+
+import litellm
+
+
+class StreamedResponse:
+    """collects the chunks of a streamed response and the tool call deltas in them"""
+
+    def __init__(self):
+        self.chunks = []
+        # index -> [id, name, arguments], the name and the arguments arrive in pieces
+        self.tool_calls = {}
+
+    def add(self, chunk) -> None:
+        self.chunks.append(chunk)
+        if not chunk.choices:  # e.g. the final usage chunk
+            return
+        for delta in chunk.choices[0].delta.tool_calls or []:
+            tool_call = self.tool_calls.setdefault(delta.index, [None, "", ""])
+            if delta.id:
+                tool_call[0] = delta.id
+            if delta.function is not None:
+                tool_call[1] += delta.function.name or ""
+                tool_call[2] += delta.function.arguments or ""
+
+    def first_complete_tool_call(self) -> Optional[Tuple[str, dict]]:
+        """name and arguments of the first tool call once its arguments are complete, the arguments are a JSON
+        object, so they can only be parsed once the closing brace arrived"""
+        if 0 not in self.tool_calls:
+            return None
+        _, name, arguments = self.tool_calls[0]
+        try:
+            return name, json.loads(arguments)
+        except json.JSONDecodeError:
+            return None
+
+    def build(self, messages: List):
+        """the complete response, the same as without streaming"""
+        return litellm.stream_chunk_builder(self.chunks, messages=messages)
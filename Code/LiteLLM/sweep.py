@@ -0,0 +1,247 @@
+"""runs the cartesian product of main.py configurations, the remaining runs of a configuration are one main.py
+subprocess (-n <remaining> -w <run workers>) writing into Logs/<batch> with the usual batch names, e.g.
+vision_legacy_picture_every_tool_call_o4-mini_reasoning, its output goes to Logs/<batch>/sweep.log
+
+example spec:
+{
+    "matrix": {
+        "model": ["o4-mini", "gpt-5-nano"],
+        "vision": ["none", "scene", "json", "legacy"],
+        "use_reasoning": [false, true],
+        "send_every_tool_call": [false]
+    },
+    "repetitions": 10,
+    "model_concurrency": {"gpt-5-nano": 2},
+    "extra_args": ["--model-cache-dir"]
+}
+"""
+import argparse
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+import itertools
+import json
+import math
+from pathlib import Path
+import subprocess
+import sys
+import threading
+import time
+from typing import Iterator, List, Optional
+
+from Code.LiteLLM.batch_index import BatchIndex
+
+cur_dir = Path(__file__).parent
+logs_dir = cur_dir / "Logs"
+repository_dir = cur_dir.parent.parent
+
+# boolean matrix entries and their main.py flags
+FLAGS = {
+    "use_reasoning": "-R",
+    "send_every_tool_call": "-s",
+    "use_all_functions": "-a",
+    "use_low_level_only": "-l",
+}
+VISION_FLAGS = {
+    "none": [],
+    "scene": ["-v"],
+    "json": ["-v", "-j"],
+    "legacy": ["--vision-legacy"],
+}
+VISION_PREFIXES = {
+    "none": "no_vision",
+    "scene": "vision",
+    "json": "json_vision",
+    "legacy": "vision_legacy",
+}
+
+parser = argparse.ArgumentParser(
+                    prog='SweepRobocasaLLM',
+                    description='Executes every configuration of the given matrix spec the given number of times')
+
+parser.add_argument('spec', type=str)  # JSON file, see the module docstring
+parser.add_argument('-w', '--workers', type=int, default=4)  # main.py processes running at the same time
+parser.add_argument('-r', '--run-workers', type=int, default=1)  # simulations running in parallel per main.py process
+parser.add_argument('-t', '--timeout', type=float, default=3600)  # seconds per run until a main.py process is killed
+# per model for the whole sweep, every main.py process of a model gets an equal share, see request_scheduler.py
+parser.add_argument('--requests-per-minute', type=float, default=None)
+parser.add_argument('--tokens-per-minute', type=float, default=None)
+parser.add_argument('--dry-run', action='store_true')  # only print the remaining runs
+parser.add_argument('--report-interval', type=float, default=30)  # seconds between the checks for finished runs
+
+
+def configurations(matrix: dict) -> Iterator[dict]:
+    keys = list(matrix)
+    for values in itertools.product(*(matrix[key] for key in keys)):
+        config = {"model": "o4-mini", "vision": "none", **dict(zip(keys, values))}
+        if config.get("use_all_functions") and config.get("use_low_level_only"):
+            continue  # rejected by main.py
+        yield config
+
+
+def batch_name(config: dict) -> str:
+    """same naming scheme as the existing batches"""
+    name = VISION_PREFIXES[config["vision"]]
+    if config.get("send_every_tool_call"):
+        name += "_picture_every_tool_call"
+    name += f"_{config['model']}"
+    if config.get("use_all_functions"):
+        name += "_all_functions"
+    if config.get("use_low_level_only"):
+        name += "_low_level_only"
+    if config.get("use_reasoning"):
+        name += "_reasoning"
+    return name
+
+
+def main_arguments(config: dict, extra_args: List[str]) -> List[str]:
+    arguments = ["-b", batch_name(config), "-m", config["model"], *VISION_FLAGS[config["vision"]]]
+    arguments += [flag for key, flag in FLAGS.items() if config.get(key)]
+    return arguments + extra_args
+
+
+class Sweep:
+    def __init__(self, spec: dict, workers: int, timeout: float, run_workers: int = 1,
+                 requests_per_minute: Optional[float] = None, tokens_per_minute: Optional[float] = None,
+                 report_interval: float = 30):
+        self.spec = spec
+        self.workers = workers
+        self.run_workers = run_workers
+        self.timeout = timeout
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        # at most this many main.py processes of a model at the same time, the others use all workers
+        self.model_concurrency = spec.get("model_concurrency", {})
+        self.condition = threading.Condition()
+        self.running = Counter()
+        # the batches of the running main.py processes and their finished runs that were already reported
+        self.active = {}
+        self.reported = {}
+        self.report_interval = report_interval
+        self.finished = 0
+        self.total = 0
+        self.start = None
+
+    def concurrency(self, model: str) -> int:
+        return min(self.workers, self.model_concurrency.get(model, self.workers))
+
+    def remaining_runs(self) -> List[tuple]:
+        """the configurations with missing runs and their number, finished runs of an interrupted sweep are skipped"""
+        remaining = []
+        for config in configurations(self.spec["matrix"]):
+            batch_path = logs_dir / batch_name(config)
+            finished = BatchIndex(batch_path).count_results() if batch_path.exists() else 0
+            if self.spec.get("repetitions", 1) > finished:
+                remaining.append((config, self.spec.get("repetitions", 1) - finished))
+        return remaining
+
+    def arguments(self, config: dict, num_runs: int) -> List[str]:
+        arguments = main_arguments(config, self.spec.get("extra_args", []))
+        arguments += ["-n", str(num_runs), "-w", str(min(num_runs, self.run_workers))]
+        # the buckets of main.py are per process, the processes of a model that may run at the same time share the
+        # limit of the sweep
+        if self.requests_per_minute is not None:
+            arguments += ["--requests-per-minute", str(self.requests_per_minute / self.concurrency(config["model"]))]
+        if self.tokens_per_minute is not None:
+            arguments += ["--tokens-per-minute", str(self.tokens_per_minute / self.concurrency(config["model"]))]
+        return arguments
+
+    def report_progress(self, name: str) -> None:
+        """prints a line for every run of the batch that finished since the last report"""
+        finished = BatchIndex(logs_dir / name).count_results()
+        with self.condition:
+            new = max(finished - self.reported[name], 0)
+            self.reported[name] = max(finished, self.reported[name])
+            for _ in range(new):
+                self.finished += 1
+                hours = (time.perf_counter() - self.start) / 3600
+                print(f"[{self.finished}/{self.total}] {name}: run finished, {self.finished / hours:.1f} runs/hour")
+
+    def report(self, stop: threading.Event) -> None:
+        """reports the finished runs while the main.py processes are still running"""
+        while not stop.wait(self.report_interval):
+            with self.condition:
+                names = list(self.active)
+            for name in names:
+                try:
+                    self.report_progress(name)
+                except Exception as e:  # e.g. the index is locked for longer than its timeout
+                    print(f"{name}: could not read the finished runs: {e}")
+
+    def run(self, config: dict, num_runs: int) -> None:
+        name = batch_name(config)
+        batch_path = logs_dir / name
+        try:
+            batch_path.mkdir(parents=True, exist_ok=True)
+            finished = BatchIndex(batch_path).count_results()
+            with self.condition:
+                self.reported[name] = finished
+                self.active[name] = config
+            with open(batch_path / "sweep.log", mode="a") as log_file:
+                status = subprocess.run([sys.executable, "-m", "Code.LiteLLM.main", *self.arguments(config, num_runs)],
+                                        cwd=repository_dir, stdout=log_file, stderr=subprocess.STDOUT,
+                                        timeout=self.timeout * math.ceil(num_runs / self.run_workers)).returncode
+        except subprocess.TimeoutExpired:
+            status = "timeout"
+        finally:
+            with self.condition:
+                self.running[config["model"]] -= 1
+                self.active.pop(name, None)
+                self.condition.notify_all()
+        self.report_progress(name)
+        print(f"{name}: main.py exited with status {status}, {self.reported[name] - finished} of {num_runs} runs "
+              f"finished")
+
+    def next_runs(self, remaining: List[tuple]) -> Optional[tuple]:
+        """the first configuration whose model has a free slot, a worker never waits for a model at its limit while
+        other models have work"""
+        if sum(self.running.values()) >= self.workers:
+            return None
+        for config, num_runs in remaining:
+            if self.running[config["model"]] < self.concurrency(config["model"]):
+                return config, num_runs
+        return None
+
+    def execute(self, dry_run: bool = False) -> None:
+        remaining = self.remaining_runs()
+        self.total = sum(num_runs for _, num_runs in remaining)
+        print(f"{self.total} runs remaining")
+        if dry_run:
+            for config, num_runs in remaining:
+                print(" ".join(self.arguments(config, num_runs)))
+            return
+        self.start = time.perf_counter()
+        stop_reporting = threading.Event()
+        reporter = threading.Thread(target=self.report, args=(stop_reporting,), daemon=True)
+        reporter.start()
+        futures = {}
+        try:
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                with self.condition:
+                    while remaining:
+                        runs = self.next_runs(remaining)
+                        if runs is None:
+                            self.condition.wait()
+                            continue
+                        remaining.remove(runs)
+                        self.running[runs[0]["model"]] += 1
+                        futures[executor.submit(self.run, *runs)] = runs[0]
+        finally:
+            stop_reporting.set()
+            reporter.join()
+        failed = [(future, config) for future, config in futures.items() if future.exception() is not None]
+        for future, config in failed:
+            print(f"{batch_name(config)}: the sweep failed to run the configuration: {future.exception()!r}")
+        if failed:
+            raise failed[0][0].exception()
+
+
+def main():
+    args = parser.parse_args()
+    with open(args.spec, mode="r") as spec_file:
+        spec = json.load(spec_file)
+    Sweep(spec, args.workers, args.timeout, args.run_workers, args.requests_per_minute,
+          args.tokens_per_minute, args.report_interval).execute(args.dry_run)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,8 @@
 from Code.robocasa_env.main import Controller
 
+controller = Controller()
 for _ in range(200):
-    controller = Controller()
+    controller.reset_episode()
     controller.start()
 
     controller.open_door()
@@ -1,7 +1,8 @@
 from Code.robocasa_env.main import Controller
 
+controller = Controller()
 for _ in range(20):
-    controller = Controller()
+    controller.reset_episode()
     controller.start()
 
     controller.open_door()
@@ -20,7 +21,7 @@ for _ in range(20):
     controller.stop()
     print("finished simulation")
 
-    controller = Controller()
+    controller.reset_episode()
     controller.start()
 
     controller.open_door()
@@ -39,7 +40,7 @@ for _ in range(20):
     controller.stop()
     print("finished simulation")
 
-    controller = Controller()
+    controller.reset_episode()
     controller.start()
 
     controller.grip_object_from_above("obj")
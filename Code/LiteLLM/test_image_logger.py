@@ -9,12 +9,11 @@ from Code.robocasa_env.main import Controller
 controller = Controller()
 controller.start()
 
-image_logger = ImageLogger(controller, ".")
-
-image_logger.get_image().show()
-sleep(5)
-image_logger.get_image().show()
-sleep(5)
-image_logger.get_image().show()
-sleep(5)
-image_logger.get_image().show()
+with ImageLogger(controller, ".") as image_logger:
+    image_logger.get_image().image.show()
+    sleep(5)
+    image_logger.get_image().image.show()
+    sleep(5)
+    image_logger.get_image().image.show()
+    sleep(5)
+    image_logger.get_image().image.show()
@@ -0,0 +1,39 @@
+from collections import Counter
+
+import numpy as np
+
+from robocasa.models.objects.kitchen_object_utils import sample_kitchen_object, sample_kitchen_object_helper, \
+    get_object_size
+
+# compares the vectorized size-filtered sampling with the rejection sampling it replaced,
+# both have to produce the same distribution over the object categories
+
+groups = ("fruit", "vegetable")
+max_size = (0.1, 0.1, None)
+samples = 20000
+
+
+def rejection_sample(rng):
+    while True:
+        mjcf_kwargs, info = sample_kitchen_object_helper(groups=groups, rng=rng)
+        obj_size = get_object_size(info["mjcf_path"]) * mjcf_kwargs["scale"]
+        if all(max_size[i] is None or obj_size[i] <= max_size[i] for i in range(3)):
+            return info
+
+
+rng = np.random.default_rng(0)
+rejection = Counter(rejection_sample(rng)["cat"] for _ in range(samples))
+
+vectorized = Counter()
+for _ in range(samples):
+    mjcf_kwargs, info = sample_kitchen_object(groups=groups, rng=rng, max_size=max_size)
+    obj_size = get_object_size(info["mjcf_path"]) * mjcf_kwargs["scale"]
+    assert all(max_size[i] is None or obj_size[i] <= max_size[i] for i in range(3)), info["mjcf_path"]
+    vectorized[info["cat"]] += 1
+
+total_variation = sum(abs(rejection[cat] - vectorized[cat]) for cat in rejection.keys() | vectorized.keys()) \
+    / (2 * samples)
+for cat in sorted(rejection.keys() | vectorized.keys()):
+    print(f"{cat}: rejection {rejection[cat] / samples:.3f}, vectorized {vectorized[cat] / samples:.3f}")
+print(f"total variation distance: {total_variation:.4f}")
+assert total_variation < 0.05
@@ -0,0 +1,22 @@
+import numpy as np
+
+from Code.robocasa_env.main import Controller
+
+# reusing a controller has to start every episode from a new scene, different seeds give different placements
+# and the same seed gives the same placement again
+
+controller = Controller(headless=True, synchronous=True)
+
+
+def object_position(seed):
+    controller.reset_episode(seed=seed)
+    return np.array(controller.observation["obj_pos"])
+
+
+first = object_position(1)
+second = object_position(2)
+repeated = object_position(1)
+print(f"seed 1: {first}, seed 2: {second}, seed 1 again: {repeated}")
+assert not np.allclose(first, second), "different seeds resulted in the same object position"
+assert np.allclose(first, repeated), "the same seed resulted in different object positions"
+print("passed")
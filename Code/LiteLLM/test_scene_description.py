@@ -8,6 +8,5 @@ environ["OPENAI_API_KEY"] = open("API_KEY", mode="r").read()
 
 controller = Controller()
 
-image_logger = ImageLogger(controller, ".")
-
-print(get_scene_description(image_logger, "o4-mini"))
+with ImageLogger(controller, ".") as image_logger:
+    print(get_scene_description(image_logger, "o4-mini"))
@@ -0,0 +1,38 @@
+import asyncio
+import tempfile
+import time
+from pathlib import Path
+
+from Code.LiteLLM.main import parser, run_batch, run_batch_async
+from Code.LiteLLM.run_trace import read_summary
+
+# full agent loop with the scripted backend, no API key or network needed
+args = parser.parse_args(["-b", "Throughput_scripted", "--backend", "scripted", "--scripted-latency", "2.0",
+                          "--synchronous", "--seed", "0", "-n", "8", "-w", "2", "--async", "-c", "4"])
+
+# not in Logs, the scripted runs would be counted with the real results of the model
+with tempfile.TemporaryDirectory() as logs_path:
+    batch_path = Path(logs_path) / args.batch_name
+    batch_path.mkdir(parents=True)
+
+    start = time.perf_counter()
+    if args.use_async:
+        asyncio.run(run_batch_async(args, batch_path))
+    else:
+        run_batch(args, batch_path)
+    duration = time.perf_counter() - start
+
+    summaries = [read_summary(path) for path in batch_path.iterdir() if path.name.startswith("RobocasaLLM_")]
+
+assert len(summaries) == args.num_runs, f"{len(summaries)} of {args.num_runs} runs were started"
+assert all(summary is not None and summary["outcome"] == "SUCCESS" for summary in summaries), \
+    [None if summary is None else summary["outcome"] for summary in summaries]
+
+runs_per_hour = len(summaries) / duration * 3600
+# the runs wait for the model concurrently, so the batch is faster than the model latency of all runs one after
+# another, even without counting the simulation
+llm_calls = sum(summary["llm_calls"] for summary in summaries)
+min_runs_per_hour = len(summaries) / (llm_calls * args.scripted_latency) * 3600
+print(f"{len(summaries)} runs in {duration:.1f}s ({runs_per_hour:.1f} runs/hour, at least "
+      f"{min_runs_per_hour:.1f} expected)")
+assert runs_per_hour > min_runs_per_hour, f"{runs_per_hour:.1f} runs/hour, expected more than {min_runs_per_hour:.1f}"
@@ -73,3 +73,46 @@ def low_level_functions(controller: Controller):
 
 def low_level_control_functions(controller: Controller):
     return available_function_generator(controller, low_level_function_subset.union(control_function_subset))
+
+
+# tool of the plan-then-execute mode, the model submits a whole sequence of calls of the given tools at once
+def plan_tool(tools: list[dict]) -> dict:
+    return {
+        "type": "function",
+        "function": {
+            "name": "submit_plan",
+            "description": "Submits the whole plan, the steps are executed in the given order until one of them "
+                           "fails. Returns a report of the failed step, its error and the current state of the task "
+                           "if a step failed",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "steps": {
+                        "type": "array",
+                        "description": "The function calls of the plan in the order they should be executed",
+                        "items": {
+                            "type": "object",
+                            "properties": {
+                                "function": {
+                                    "type": "string",
+                                    "enum": [tool["function"]["name"] for tool in tools],
+                                    "description": "The name of the function to call"
+                                },
+                                "arguments": {
+                                    "type": "object",
+                                    "description": "The arguments of the function as specified by its parameters"
+                                }
+                            },
+                            "required": [
+                                "function",
+                                "arguments"
+                            ]
+                        }
+                    }
+                },
+                "required": [
+                    "steps"
+                ]
+            }
+        }
+    }
@@ -2,7 +2,7 @@ from math import atan2, pi
 from time import sleep
 import threading
 
-from typing import Sequence
+from typing import Callable, Sequence
 
 import numpy as np
 from scipy.spatial.transform import Rotation
@@ -11,6 +11,7 @@ import mujoco
 
 import robosuite as suite
 from robosuite.controllers.composite.composite_controller_factory import load_composite_controller_config
+from robosuite.utils.binding_utils import MjRenderContextOffscreen
 
 # noinspection PyUnresolvedReferences
 import robocasa  # needed for the environments, doesn't find them otherwise
@@ -18,8 +19,14 @@ from robocasa.utils.object_utils import compute_rel_transform, obj_inside_of, gr
 
 
 class Controller:
-    def __init__(self, headless=False):
+    def __init__(self, headless=False, synchronous=False, seed=None, model_cache_dir=None, render_size=(1280, 720)):
         self.headless = headless
+        # width and height of the frames returned by get_vision_data
+        self.render_width, self.render_height = render_size
+        # get_vision_data renders into this buffer instead of allocating a new frame every time
+        self.frame_buffer = np.empty((self.render_height, self.render_width, 3), dtype=np.uint8)
+        # in synchronous mode there is no simulation thread, the primitives step the environment themselves
+        self.synchronous = synchronous
 
         self.max_velocity = 0.3
         self.min_velocity = 0.03
@@ -34,21 +41,30 @@ class Controller:
             "layout_ids": [0],  # change for different kitchen layout
             "style_ids": [0]  # change for different kitchen style
         }
+        if seed is not None:
+            options["seed"] = seed
+        if model_cache_dir is not None:
+            # load the compiled MjModel from disk if this kitchen was compiled before
+            options["model_cache_dir"] = str(model_cache_dir)
         self.env = suite.make(
             **options,
             has_renderer=not headless,
-            has_offscreen_renderer=True,
+            has_offscreen_renderer=False,  # created on the first call of get_vision_data
             render_camera=None,
             ignore_done=True,
+            hard_reset=False,  # keep the compiled model between episodes, see reset_episode
             use_camera_obs=False,
             control_freq=10,
             renderer="mjviewer",
             camera_names="robot0_agentview_center",
-            camera_heights=720,  # Height in pixels
-            camera_widths=1280  # Width in pixels
+            camera_heights=self.render_height,  # Height in pixels
+            camera_widths=self.render_width  # Width in pixels
         )
 
-        self.env.reset()
+        # snapshot of the most recent step, filled once per step and read by all accessors
+        self.observation = {}
+        self.task_completed = False
+        self._update_state(self.env.reset())
 
         self.action_dim = self.env.action_spec[0].shape[0]
 
@@ -58,7 +74,12 @@ class Controller:
 
         self.simulation_is_running = False
 
-        self.simulation = threading.Thread(target=self._simulate)
+        # the simulation thread publishes every finished step here, primitives block on it instead of polling
+        self.step_condition = threading.Condition()
+        self.step_count = 0
+
+        # a thread can only be started once, start() creates a new one for every episode
+        self.simulation = None
 
         if not headless:
             self.env.viewer.set_camera(camera_id=2)
@@ -66,38 +87,154 @@ class Controller:
         self.env.objects["obj"].friction = (10, 3, 1)
 
         self.ran_successfully = False
+        # check_* values of the finished episode, _finish resets the environment afterwards
+        self.final_state = None
 
     def _simulate(self) -> None:
         while self.simulation_is_running and not self.check_successful():
-            self.env.step(self.movement)
-            if not self.headless:
-                self.env.render()
+            self._step()
+        self._finish()
+
+    def _step(self) -> None:
+        observation, _, _, _ = self.env.step(self.movement)
+        self._update_state(observation)
+        if not self.headless:
+            self.env.render()
+        self._publish_step()
+
+    def _finish(self) -> None:
         # when the simulation is finished
         self.ran_successfully = self.check_successful()
-        self.simulation_is_running = False
+        self.final_state = self.get_task_state()
+        with self.step_condition:
+            self.simulation_is_running = False
+            self.step_condition.notify_all()
         if not self.headless:
             self.env.close_renderer()
-        self.env.reset()
+        self._update_state(self.env.reset())
+
+    def _update_state(self, observation: dict) -> None:
+        """stores the observations that env.step already computed, so that reading a single value does not
+        recompute every observable through observation_spec()"""
+        self.observation = observation
+        self.task_completed = self.check_object_in_microwave() \
+            and self.check_button_pressed() \
+            and self.check_gripper_away_from_microwave()
 
     def start(self) -> None:
         self.simulation_is_running = True
         self.ran_successfully = False
-        self.simulation.start()
+        self.final_state = None
+        if not self.synchronous:
+            self.simulation = threading.Thread(target=self._simulate)
+            self.simulation.start()
 
     def stop(self) -> None:
-        self.simulation_is_running = False
-        self.simulation.join()
+        if self.synchronous:
+            if self.simulation_is_running:
+                self._finish()
+            return
+        with self.step_condition:
+            self.simulation_is_running = False
+            self.step_condition.notify_all()
+        if self.simulation is not None:
+            self.simulation.join()
+
+    def reset_episode(self, seed=None, resample_objects=False) -> None:
+        """prepares the next episode on the already compiled environment, only the object placement is sampled
+        again, resample_objects rebuilds the whole model including the sampled objects"""
+        if self.simulation_is_running:
+            self.stop()
+        if seed is not None:
+            # reseed in place, the placement samplers keep a reference to the generator of the environment
+            self.env.rng.bit_generator.state = np.random.default_rng(seed).bit_generator.state
+        # the soft reset only re-applies the cached placements, without new ones every episode starts from the same
+        # scene, if the current objects can't be placed anymore the model is rebuilt
+        if not resample_objects and not self.env.resample_object_placements():
+            resample_objects = True
+        self.env.hard_reset = resample_objects
+        try:
+            observation = self.env.reset()
+        finally:
+            self.env.hard_reset = False
+        self._update_state(observation)
+        self.movement = np.zeros(self.action_dim)
+        self.ran_successfully = False
 
-    def get_vision_data(self):
-        return np.flipud(self.env.sim.render(camera_name="robot0_agentview_center",
-                                             height=720,  # Height in pixels
-                                             width=1280,  # Width in pixels
-                                             depth=False
-                                             ))
+        if not self.headless:
+            self.env.viewer.set_camera(camera_id=2)
+
+    def _publish_step(self) -> None:
+        """wakes up all primitives that wait for the simulation to advance"""
+        with self.step_condition:
+            self.step_count += 1
+            self.step_condition.notify_all()
+
+    def wait_for_steps(self, steps: int = 1) -> bool:
+        """blocks until the simulation advanced by the given number of steps,
+        returns False if the simulation stopped in the meantime"""
+        if self.synchronous:
+            for _ in range(steps):
+                if not self.simulation_is_running:
+                    return False
+                if self.check_successful():
+                    self._finish()
+                    return False
+                self._step()
+            return True
+        with self.step_condition:
+            target = self.step_count + steps
+            self.step_condition.wait_for(lambda: self.step_count >= target or not self.simulation_is_running)
+            return self.step_count >= target
+
+    def wait_until(self, condition: Callable[[], bool]) -> bool:
+        """blocks until the condition holds, it is only reevaluated after each simulation step,
+        returns False if the simulation stopped before the condition was met"""
+        while not condition():
+            if not self.wait_for_steps():
+                return False
+        return True
+
+    def seconds_to_steps(self, seconds: float) -> int:
+        """converts a duration in simulated seconds into the number of control steps"""
+        return max(1, round(seconds * self.env.control_freq))
+
+    def hold(self, seconds: float) -> bool:
+        """keeps the current movement for the given duration, counted in simulation steps in synchronous mode
+        and in wall-clock time otherwise, returns False if the simulation stopped"""
+        if self.synchronous:
+            return self.wait_for_steps(self.seconds_to_steps(seconds))
+        sleep(seconds)
+        return self.simulation_is_running
+
+    def _get_render_context(self) -> MjRenderContextOffscreen:
+        """creates the offscreen renderer on first use, runs without vision or picture logging never need it"""
+        sim = self.env.sim
+        if sim._render_context_offscreen is None:
+            # registers itself with the sim, same setup as robosuite does for has_offscreen_renderer
+            MjRenderContextOffscreen(sim, device_id=self.env.render_gpu_device_id)
+            sim._render_context_offscreen.vopt.geomgroup[0] = 1 if self.env.render_collision_mesh else 0
+            sim._render_context_offscreen.vopt.geomgroup[1] = 1 if self.env.render_visual_mesh else 0
+            # recreate it after hard resets from now on
+            self.env.has_offscreen_renderer = True
+        return sim._render_context_offscreen
+
+    def get_vision_data(self) -> np.ndarray:
+        """renders the agentview camera into the preallocated frame buffer and returns an upright view of it,
+        the view is overwritten by the next call, copy it if it has to outlive that"""
+        render_context = self._get_render_context()
+        render_context.gl_ctx.make_current()
+        render_context.render(width=self.render_width, height=self.render_height,
+                              camera_id=self.env.sim.model.camera_name2id("robot0_agentview_center"))
+        mujoco.mjr_readPixels(rgb=self.frame_buffer, depth=None,
+                              viewport=mujoco.MjrRect(0, 0, self.render_width, self.render_height),
+                              con=render_context.con)
+        # the frame is read bottom to top, flipping the view does not copy it
+        return self.frame_buffer[::-1]
 
     # maybe add to available commands
     def check_gripping_object(self) -> bool:
-        return sum(abs(self.env.observation_spec()["robot0_gripper_qpos"])) > 0.0011
+        return sum(abs(self.observation["robot0_gripper_qpos"])) > 0.0011
 
     def check_object_in_microwave(self):
         return obj_inside_of(self.env, "obj", self.env.microwave)
@@ -110,10 +247,16 @@ class Controller:
 
     # maybe add to available commands
     def check_successful(self):
-        return self.check_object_in_microwave() \
-            and self.check_button_pressed() \
-            and self.check_gripper_away_from_microwave() \
-            or self.ran_successfully
+        return self.task_completed or self.ran_successfully
+
+    def get_task_state(self) -> dict[str, bool]:
+        return {"object_in_microwave": bool(self.check_object_in_microwave()),
+                "button_pressed": bool(self.check_button_pressed()),
+                "gripper_away_from_microwave": bool(self.check_gripper_away_from_microwave())}
+
+    def get_final_state(self) -> dict[str, bool]:
+        """the check_* values at the end of the episode, taken before the reset, or the current ones while it runs"""
+        return self.final_state if self.final_state is not None else self.get_task_state()
 
     def transform_to_robot_frame(self, coordinates: Sequence[int], orientation=np.identity(3)) \
             -> (np.ndarray, np.ndarray):
@@ -122,19 +265,19 @@ class Controller:
 
     def get_eef_pos(self) -> np.ndarray:
         """returns the eef pos relative to the robot frame"""
-        return self.transform_to_robot_frame(self.env.observation_spec()["robot0_eef_pos"])[0]
+        return self.transform_to_robot_frame(self.observation["robot0_eef_pos"])[0]
 
     def get_eef_rot(self) -> np.ndarray:
         """returns the eef rotation relative to the robot frame"""
         return Rotation.from_matrix(
             self.transform_to_robot_frame(
-                self.env.observation_spec()["robot0_eef_pos"],
-                Rotation.from_quat(self.env.observation_spec()["robot0_eef_quat"]).as_matrix())[1]
+                self.observation["robot0_eef_pos"],
+                Rotation.from_quat(self.observation["robot0_eef_quat"]).as_matrix())[1]
         ).as_euler("xyz") / pi * 180
 
     def resolve_object_from_name(self, object_name: str) -> dict[str, list]:
         """finds position and rotation of the object with the given name and returns it in the robot frame"""
-        observation = self.env.observation_spec()
+        observation = self.observation
         print(f'Resolved "{object_name}" '
               f'to ("pos": {observation[f"{object_name}_pos"]} "quat": {observation[f"{object_name}_quat"]})')
         result = self.transform_to_robot_frame(
@@ -146,18 +289,16 @@ class Controller:
     def open_gripper(self) -> None:
         """opens gripper"""
         self.movement[6] = -1
-        while (self.env.observation_spec()["robot0_gripper_qpos"][0] < 0.0395 and
-               self.env.observation_spec()["robot0_gripper_qpos"][1] > -0.0395):
-            pass
+        self.wait_until(lambda: not (self.observation["robot0_gripper_qpos"][0] < 0.0395 and
+                                     self.observation["robot0_gripper_qpos"][1] > -0.0395))
         self.movement[6] = 0
         print("opened gripper")
 
     def close_gripper(self) -> None:
         """closes gripper"""
         self.movement[6] = 1
-        sleep(0.1)
-        while np.max(abs(self.env.observation_spec()["robot0_gripper_qvel"])) > 0.01:
-            pass
+        self.hold(0.1)
+        self.wait_until(lambda: np.max(abs(self.observation["robot0_gripper_qvel"])) <= 0.01)
         self.movement[6] = 0
         print("closed gripper")
         # return self.check_gripping_object()
@@ -179,6 +320,9 @@ class Controller:
                 velocity = self.min_velocity
             velocities = vector / distance * velocity
             self.movement[:3] = velocities
+            if not self.wait_for_steps():
+                self.movement[:3] = np.zeros(3)
+                return False
             # if self.env.timestep % 80 == 0:
             #     if prior_vector is not None and sum(abs(prior_vector - vector)) < 0.1 \
             #             and self.env.timestep != prior_timestep:
@@ -222,6 +366,9 @@ class Controller:
             if all(v == 0 for v in angle_velocities):
                 break
 
+            if not self.wait_for_steps():
+                break
+
         self.movement[3:6] = np.zeros(3)
         print(f'rotated gripper to {", ".join([str(rot) for rot in end_rotation])}')
 
@@ -237,7 +384,7 @@ class Controller:
                              f'or quaternion (4 values), not {len(end_rotation)} values')
 
         while True:
-            current_quat = self.env.observation_spec()["robot0_eef_quat"]
+            current_quat = self.observation["robot0_eef_quat"]
             # current_quat = Rotation.from_matrix(np.dot(Rotation.from_quat(self.env.observation_spec()["robot0_eef_quat"]).as_matrix(), self.env.robots[0].base_ori)).as_quat(False)
 
             # calculate the rotation required to get from the current rotation to the target rotation and convert it to a vector
@@ -258,6 +405,9 @@ class Controller:
 
             self.movement[3:6] = axis_vector
 
+            if not self.wait_for_steps():
+                break
+
         self.movement[3:6] = np.zeros(3)
         print("done")
 
@@ -361,7 +511,7 @@ class Controller:
             return False
         self.approach_destination_from_direction(button_pos_rel, "front")
         self.movement[0] = self.max_velocity
-        sleep(1)
+        self.hold(1)
         self.movement[0] = 0
         return True
 
@@ -384,6 +534,8 @@ class Controller:
         while abs(vector[1]) > 0.15:
             tangential_vector = np.dot(vector, np.array([[0, -1], [1, 0]]))
             self.movement[0:2] = tangential_vector * self.max_velocity
+            if not self.wait_for_steps():
+                break
 
             vector = (self.get_eef_pos() - joint_pos)[:2]
             vector = vector / np.linalg.norm(vector)
@@ -397,9 +549,12 @@ class Controller:
         vector = vector / np.linalg.norm(vector)
         # possibly in world coordinates, requires testing
         self.movement[1] = self.max_velocity
-        while abs(vector[1]) > 0.2:
-            vector = (self.get_eef_pos() - joint_pos)[:2]
-            vector = vector / np.linalg.norm(vector)
+
+        def door_swung_open():
+            current_vector = (self.get_eef_pos() - joint_pos)[:2]
+            return abs((current_vector / np.linalg.norm(current_vector))[1]) <= 0.2
+
+        self.wait_until(door_swung_open)
         self.movement[1] = 0
         if not self.move_abs(*(self.get_eef_pos() + [0.15, -0.1, -0.26])):
             return False
@@ -420,7 +575,7 @@ class Controller:
         if not self.move_abs(joint_pos[0] - 0.15, microwave_pos[1], microwave_pos[2] - 0.05):
             return False
         self.movement[0] = self.max_velocity
-        sleep(2)
+        self.hold(2)
         self.movement[0] = 0
         print("closed door")
         return True
@@ -429,18 +584,15 @@ class Controller:
     def put_down_object_at_current_pos(self, object_name: str) -> None:
         # maybe needs fixing because of relative coordinates
         """Opens gripper and places object on ground"""
-        initial_time = self.env.timestep
-        prior_time = initial_time
         prior_pos = np.array(self.resolve_object_from_name(object_name)["pos"])
         self.movement[2] = -self.max_velocity
 
-        while self.env.timestep == prior_time or \
-                abs((prior_pos - self.resolve_object_from_name(object_name)["pos"])[2]) > 0.0001:
-            if self.env.timestep == prior_time:
-                sleep(1 / 80)
-                continue
-            prior_time = self.env.timestep
-            prior_pos = np.array(self.resolve_object_from_name(object_name)["pos"])
+        # lower the object until its height stops changing from one step to the next
+        while self.wait_for_steps():
+            current_pos = np.array(self.resolve_object_from_name(object_name)["pos"])
+            if abs((prior_pos - current_pos)[2]) <= 0.0001:
+                break
+            prior_pos = current_pos
         self.movement[2] = 0
         self.open_gripper()
         print(f'placed object "{object_name}"')
@@ -464,7 +616,7 @@ class Controller:
             ))
             self.approach_destination_from_direction(dest_pos + [front_offset, 0, height_offset], "front")
         self.open_gripper()
-        sleep(1)
+        self.hold(1)
 
         print(f'placed object {object_name}{f" at {destination_name}" if destination_name is not None else ""}')
 
@@ -0,0 +1,90 @@
+import multiprocessing
+import threading
+
+from Code.robocasa_env.main import Controller
+
+
+def _serve_controller(connection, controller_kwargs: dict) -> None:
+    """runs in the worker process, owns one simulation and executes the requests sent by the proxy"""
+    controller = Controller(**controller_kwargs)
+    while True:
+        request = connection.recv()
+        if request is None:
+            break
+        name, args, kwargs = request
+        try:
+            result = getattr(controller, name)(*args, **kwargs)
+        except Exception as e:
+            connection.send((False, e))
+        else:
+            connection.send((True, result))
+    if controller.simulation_is_running:
+        controller.stop()
+    connection.close()
+
+
+class ControllerProxy:
+    """stands in for a Controller that lives in a worker process, every method call is forwarded to it"""
+
+    def __init__(self, connection, process):
+        self._connection = connection
+        self._process = process
+        self._lock = threading.Lock()
+
+    def _call(self, name: str, *args, **kwargs):
+        with self._lock:
+            self._connection.send((name, args, kwargs))
+            succeeded, result = self._connection.recv()
+        if not succeeded:
+            raise result
+        return result
+
+    def __getattr__(self, name: str):
+        if name.startswith("_"):
+            raise AttributeError(name)
+
+        def remote_method(*args, **kwargs):
+            return self._call(name, *args, **kwargs)
+
+        # the function name is used to build the tool mapping in utils.all_functions
+        remote_method.__name__ = name
+        return remote_method
+
+
+class ControllerPool:
+    """owns one MicrowaveThawing simulation per worker process and exposes each of them as a ControllerProxy"""
+
+    def __init__(self, size: int, **controller_kwargs):
+        # spawn instead of fork, forking a process that already holds MuJoCo/OpenGL state is not safe
+        context = multiprocessing.get_context("spawn")
+        self.slots = []
+        for _ in range(size):
+            parent_connection, child_connection = context.Pipe()
+            process = context.Process(target=_serve_controller, args=(child_connection, controller_kwargs),
+                                      daemon=True)
+            process.start()
+            self.slots.append(ControllerProxy(parent_connection, process))
+
+    def __len__(self) -> int:
+        return len(self.slots)
+
+    def __getitem__(self, index: int) -> ControllerProxy:
+        return self.slots[index]
+
+    def __iter__(self):
+        return iter(self.slots)
+
+    def close(self) -> None:
+        for slot in self.slots:
+            try:
+                slot._connection.send(None)
+            except (BrokenPipeError, OSError):
+                pass
+        for slot in self.slots:
+            slot._process.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
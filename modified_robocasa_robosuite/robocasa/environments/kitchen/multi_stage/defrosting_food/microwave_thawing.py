@@ -1,4 +1,8 @@
+from robosuite.utils.binding_utils import MjSim
+from robosuite.utils.errors import RandomizationError
+
 from robocasa.environments.kitchen.kitchen import *
+from robocasa.utils.model_cache import load_or_compile_model
 
 
 class MicrowaveThawing(Kitchen):
@@ -10,14 +14,55 @@ class MicrowaveThawing(Kitchen):
     Steps:
         Pick the food from the counter and place it in the microwave.
         Then turn on the microwave.
+
+    Args:
+        model_cache_dir (str): if set, compiled models are stored in and loaded from this directory,
+            see robocasa.utils.model_cache
     """
 
     # exclude layout 8 because the microwave is far from counters
     EXCLUDE_LAYOUTS = [8]
 
-    def __init__(self, *args, **kwargs):
+    def __init__(self, *args, model_cache_dir=None, **kwargs):
+        self.model_cache_dir = model_cache_dir
         super().__init__(*args, **kwargs)
 
+    def _initialize_sim(self, xml_string=None):
+        """
+        Same as MujocoEnv._initialize_sim, but the compiled model is loaded from the model cache if one is set.
+        """
+        if self.model_cache_dir is None:
+            return super()._initialize_sim(xml_string)
+        xml = xml_string if xml_string else self.model.get_xml()
+        if self._xml_processor is not None:
+            xml = self._xml_processor(xml)
+        self.sim = MjSim(load_or_compile_model(xml, self.model_cache_dir))
+        self.sim.forward()
+        # general env setup, same as the base class
+        self.initialize_time(self.control_freq)
+
+    def resample_object_placements(self, max_attempts=10):
+        """
+        Samples new placements for the objects of the current model. Kitchen only samples them when the model is
+        loaded, a soft reset (hard_reset=False) re-applies the cached object_placements, so this has to be called
+        before such a reset to start from a different scene.
+
+        Args:
+            max_attempts (int): number of placement samples that are tried
+
+        Returns:
+            bool: False if no valid placement was found, the previous placements are kept in that case
+        """
+        for _ in range(max_attempts):
+            try:
+                self.object_placements = self.placement_initializer.sample(
+                    placed_objects=self.fxtr_placements
+                )
+            except RandomizationError:
+                continue
+            return True
+        return False
+
     def _setup_kitchen_references(self):
         super()._setup_kitchen_references()
         self.microwave = self.register_fixture_ref(
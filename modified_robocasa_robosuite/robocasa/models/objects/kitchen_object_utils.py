@@ -1,7 +1,11 @@
+import atexit
+import json
 import math
 import os
+import warnings
 import xml.etree.ElementTree as ET
 from copy import deepcopy
+from functools import lru_cache
 
 import numpy as np
 from robosuite.utils.mjcf_utils import find_elements, string_to_array
@@ -11,6 +15,173 @@ from robocasa.models.objects.kitchen_objects import OBJ_CATEGORIES, OBJ_GROUPS
 
 BASE_ASSET_ZOO_PATH = os.path.join(robocasa.models.assets_root, "objects")
 
+# persistent index of the object assets, maps every model folder to its model.xml files and their size sites
+ASSET_INDEX_PATH = os.path.join(
+    os.path.expanduser("~"), ".cache", "robocasa", "object_asset_index.json"
+)
+ASSET_INDEX_VERSION = 2
+OBJECT_SITE_NAMES = ("bottom_site", "top_site", "horizontal_radius_site")
+
+
+def _get_mtime(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+def _read_object_sites(mjcf_path):
+    """
+    Parses the positions of the sites that define the size of an object model.
+
+    Args:
+        mjcf_path (str): path of the model.xml
+
+    Returns:
+        dict: site name to position, None for sites that the model does not define
+    """
+    root = ET.parse(mjcf_path).getroot()
+    sites = {}
+    for site_name in OBJECT_SITE_NAMES:
+        site = find_elements(root=root, tags="site", attribs={"name": site_name})
+        sites[site_name] = (
+            None if site is None else string_to_array(site.get("pos")).tolist()
+        )
+    return sites
+
+
+def _scan_model_folder(folder):
+    """
+    Walks a model folder once and records its model.xml files, their size sites and the modification times
+    of every visited directory and file, which are used to detect changes to the assets later on. Models that
+    can not be parsed are recorded without sites and skipped until they change.
+    """
+    cat_path = os.path.join(BASE_ASSET_ZOO_PATH, folder)
+    dirs = {cat_path: _get_mtime(cat_path)}
+    models = {}
+    for root, _, files in os.walk(cat_path):
+        dirs[root] = _get_mtime(root)
+        if "model.xml" in files:
+            mjcf_path = os.path.join(root, "model.xml")
+            try:
+                sites = _read_object_sites(mjcf_path)
+            except (ET.ParseError, ValueError) as e:
+                warnings.warn("skipping object model {}: {}".format(mjcf_path, e))
+                sites = None
+            models[mjcf_path] = dict(mtime=_get_mtime(mjcf_path), sites=sites)
+    return dict(dirs=dirs, models=models)
+
+
+def _is_folder_entry_valid(entry):
+    return all(_get_mtime(path) == mtime for path, mtime in entry["dirs"].items()) and all(
+        _get_mtime(path) == model["mtime"] for path, model in entry["models"].items()
+    )
+
+
+def _load_asset_index():
+    try:
+        with open(ASSET_INDEX_PATH, "r") as f:
+            index = json.load(f)
+    except (OSError, ValueError):
+        index = None
+    if (
+        index is None
+        or index.get("version") != ASSET_INDEX_VERSION
+        or index.get("asset_root") != BASE_ASSET_ZOO_PATH
+    ):
+        index = dict(version=ASSET_INDEX_VERSION, asset_root=BASE_ASSET_ZOO_PATH, folders={})
+    return index
+
+
+_asset_index = _load_asset_index()
+_asset_index_changed = False
+# flat view of all indexed models, mjcf path to size sites
+_object_sites = {}
+
+
+def get_indexed_mjcf_paths(folder):
+    """
+    Returns the model.xml paths inside a model folder from the asset index, the folder is only walked again
+    if it is not indexed yet or if any of its directories or models changed since it was indexed. Models that
+    could not be parsed are left out.
+
+    Args:
+        folder (str): model folder relative to BASE_ASSET_ZOO_PATH
+
+    Returns:
+        list: paths of the model.xml files in the folder
+    """
+    global _asset_index_changed
+    entry = _asset_index["folders"].get(folder)
+    if entry is None or not _is_folder_entry_valid(entry):
+        entry = _scan_model_folder(folder)
+        _asset_index["folders"][folder] = entry
+        _asset_index_changed = True
+    mjcf_paths = []
+    for mjcf_path, model in entry["models"].items():
+        if model["sites"] is not None:
+            _object_sites[mjcf_path] = model["sites"]
+            mjcf_paths.append(mjcf_path)
+    return mjcf_paths
+
+
+@atexit.register
+def save_asset_index():
+    """
+    Writes the asset index to ASSET_INDEX_PATH if it changed, a missing or read-only cache directory only
+    means that the folders are walked again by the next process. Called at exit, since the folders of a
+    category are only indexed when the category is used.
+    """
+    global _asset_index_changed
+    if not _asset_index_changed:
+        return
+    try:
+        os.makedirs(os.path.dirname(ASSET_INDEX_PATH), exist_ok=True)
+        tmp_path = "{}.{}.tmp".format(ASSET_INDEX_PATH, os.getpid())
+        with open(tmp_path, "w") as f:
+            json.dump(_asset_index, f)
+        os.replace(tmp_path, ASSET_INDEX_PATH)
+        _asset_index_changed = False
+    except OSError:
+        pass
+
+
+def get_object_sites(mjcf_path):
+    """
+    Returns the bottom, top and horizontal radius site positions of an object model, taken from the asset index
+    and only parsed from the mjcf if the model is not part of any indexed folder.
+
+    Args:
+        mjcf_path (str): path of the model.xml
+
+    Returns:
+        tuple: bottom, top and horizontal radius positions as np.arrays
+    """
+    sites = _object_sites.get(mjcf_path)
+    if sites is None:
+        sites = _read_object_sites(mjcf_path)
+        _object_sites[mjcf_path] = sites
+    for site_name in OBJECT_SITE_NAMES:
+        if sites[site_name] is None:
+            raise ValueError("{} does not define the site {}".format(mjcf_path, site_name))
+    return tuple(np.array(sites[site_name]) for site_name in OBJECT_SITE_NAMES)
+
+
+def get_object_size(mjcf_path):
+    """
+    Returns the unscaled size of an object model as (x, y, z) extents.
+
+    Args:
+        mjcf_path (str): path of the model.xml
+
+    Returns:
+        np.array: horizontal diameters along x and y and the height of the object
+    """
+    bottom, top, horizontal_radius = get_object_sites(mjcf_path)
+    return np.array(
+        [horizontal_radius[0] * 2, horizontal_radius[1] * 2, top[2] - bottom[2]]
+    )
+
 
 class ObjCat:
     """
@@ -93,16 +264,50 @@ class ObjCat:
         if model_folders is None:
             subf = "aigen_objs" if self.aigen_cat else "objaverse"
             model_folders = ["{}/{}".format(subf, name)]
-        cat_mjcf_paths = []
-        for folder in model_folders:
-            cat_path = os.path.join(BASE_ASSET_ZOO_PATH, folder)
-            for root, _, files in os.walk(cat_path):
-                if "model.xml" in files:
-                    model_name = os.path.basename(root)
+        self.model_folders = model_folders
+        # the models are looked up in the asset index when the category is first used, not on import
+        self._mjcf_paths = None
+        self._sizes = None
+
+    def contains_folder_of(self, mjcf_path):
+        """
+        Whether the mjcf path lies inside one of the model folders, without looking up the models.
+        """
+        return any(
+            mjcf_path.startswith(os.path.join(BASE_ASSET_ZOO_PATH, folder) + os.sep)
+            for folder in self.model_folders
+        )
+
+    @property
+    def mjcf_paths(self):
+        """
+        sorted model.xml paths of the category
+        """
+        if self._mjcf_paths is None:
+            cat_mjcf_paths = []
+            for folder in self.model_folders:
+                for mjcf_path in get_indexed_mjcf_paths(folder):
+                    model_name = os.path.basename(os.path.dirname(mjcf_path))
                     if model_name in self.exclude:
                         continue
-                    cat_mjcf_paths.append(os.path.join(root, "model.xml"))
-        self.mjcf_paths = sorted(cat_mjcf_paths)
+                    cat_mjcf_paths.append(mjcf_path)
+            self._mjcf_paths = sorted(cat_mjcf_paths)
+        return self._mjcf_paths
+
+    @property
+    def sizes(self):
+        """
+        unscaled sizes aligned with mjcf_paths, nan for models that don't define their size sites
+        """
+        if self._sizes is None:
+            sizes = []
+            for mjcf_path in self.mjcf_paths:
+                try:
+                    sizes.append(get_object_size(mjcf_path))
+                except ValueError:
+                    sizes.append(np.full(3, np.nan))
+            self._sizes = np.array(sizes).reshape(-1, 3)
+        return self._sizes
 
     def get_mjcf_kwargs(self):
         """
@@ -152,6 +357,14 @@ for (name, kwargs) in OBJ_CATEGORIES.items():
             name=name, aigen_cat=True, **aigen_kwargs
         )
 
+# inverse index, built once: category to the groups containing it (in OBJ_GROUPS order)
+CATEGORY_TO_GROUPS = {}
+for (group, group_cats) in OBJ_GROUPS.items():
+    for cat in group_cats:
+        groups_of_cat = CATEGORY_TO_GROUPS.setdefault(cat, [])
+        if group not in groups_of_cat:
+            groups_of_cat.append(group)
+
 
 def sample_kitchen_object(
     groups,
@@ -170,6 +383,13 @@ def sample_kitchen_object(
     """
     Sample a kitchen object from the specified groups and within max_size bounds.
 
+    The objects are drawn from the same distribution as repeatedly sampling with sample_kitchen_object_helper and
+    rejecting every object that exceeds max_size: the helper picks a valid category uniformly, a registry
+    proportionally to its number of models and then a model uniformly, so every model m of category c has the
+    weight 1 / (number of valid categories * number of models of c). Instead of retrying, all candidate models
+    are masked by their precomputed (scaled) size and a single model is drawn with the renormalized weights.
+    Unlike the rejection loop, which would never terminate, a ValueError is raised if no candidate fits.
+
     Args:
         groups (list or str): groups to sample from or the exact xml path of the object to spawn
 
@@ -192,7 +412,7 @@ def sample_kitchen_object(
         split (str): split to sample from. Split "A" specifies all but the last 3 object instances
                     (or the first half - whichever is larger), "B" specifies the  rest, and None specifies all.
 
-        max_size (tuple): max size of the object. If the sampled object is not within bounds of max size, function will resample
+        max_size (tuple): max size of the object. Only objects within bounds of max size are sampled
 
         object_scale (float): scale of the object. If set will multiply the scale of the sampled object by this value
 
@@ -200,57 +420,207 @@ def sample_kitchen_object(
     Returns:
         dict: kwargs to apply to the MJCF model for the sampled object
 
-        dict: info about the sampled object - the path of the mjcf, groups which the object's category belongs to, the category of the object
-              the sampling split the object came from, and the groups the object was sampled from
+        dict: info about the sampled object - the path of the mjcf, groups which the object's category belongs to,
+              the category of the object the sampling split the object came from, and the groups the object was
+              sampled from
     """
-    valid_object_sampled = False
-    while valid_object_sampled is False:
+    if rng is None:
+        rng = np.random.default_rng()
+
+    # a specific object is not sampled, it only has to fit
+    if isinstance(groups, str) and groups.endswith(".xml"):
         mjcf_kwargs, info = sample_kitchen_object_helper(
             groups=groups,
-            exclude_groups=exclude_groups,
-            graspable=graspable,
-            washable=washable,
-            microwavable=microwavable,
-            cookable=cookable,
-            freezable=freezable,
-            rng=rng,
             obj_registries=obj_registries,
             split=split,
             object_scale=object_scale,
         )
-
-        # check if object size is within bounds
-        mjcf_path = info["mjcf_path"]
-        tree = ET.parse(mjcf_path)
-        root = tree.getroot()
-        bottom = string_to_array(
-            find_elements(root=root, tags="site", attribs={"name": "bottom_site"}).get(
-                "pos"
-            )
-        )
-        top = string_to_array(
-            find_elements(root=root, tags="site", attribs={"name": "top_site"}).get(
-                "pos"
+        obj_size = get_object_size(info["mjcf_path"]) * mjcf_kwargs["scale"]
+        if not np.all(_get_size_mask(obj_size[np.newaxis], max_size)):
+            raise ValueError(
+                "{} does not fit within max_size {}".format(groups, max_size)
             )
+        return mjcf_kwargs, info
+
+    groups, exclude_groups = _normalize_groups(groups, exclude_groups)
+    valid_categories = _get_valid_categories(
+        tuple(groups),
+        tuple(exclude_groups),
+        graspable=graspable,
+        washable=washable,
+        microwavable=microwavable,
+        cookable=cookable,
+        freezable=freezable,
+        obj_registries=tuple(obj_registries),
+    )
+
+    # collect every candidate model with its sampling weight and scaled size
+    candidates = []
+    weights = []
+    sizes = []
+    for cat in valid_categories:
+        choices = _get_split_choices(cat, obj_registries, split)
+        num_cat_models = sum(len(reg_choices) for reg_choices, _ in choices.values())
+        for reg, (reg_choices, reg_sizes) in choices.items():
+            if len(reg_choices) == 0:
+                continue
+            scale = OBJ_CATEGORIES[cat][reg].scale
+            if object_scale is not None:
+                scale *= object_scale
+            candidates.extend((cat, reg, mjcf_path) for mjcf_path in reg_choices)
+            weights.append(np.full(len(reg_choices), 1.0 / num_cat_models))
+            sizes.append(reg_sizes * scale)
+
+    if len(candidates) == 0:
+        raise ValueError("no objects to sample from in groups {}".format(groups))
+    weights = np.concatenate(weights) * _get_size_mask(np.concatenate(sizes), max_size)
+    if weights.sum() == 0:
+        raise ValueError(
+            "no object in groups {} fits within max_size {}".format(groups, max_size)
         )
-        horizontal_radius = string_to_array(
-            find_elements(
-                root=root, tags="site", attribs={"name": "horizontal_radius_site"}
-            ).get("pos")
-        )
-        scale = mjcf_kwargs["scale"]
-        obj_size = (
-            np.array(
-                [horizontal_radius[0] * 2, horizontal_radius[1] * 2, top[2] - bottom[2]]
+
+    cat, chosen_reg, mjcf_path = candidates[
+        rng.choice(len(candidates), p=weights / weights.sum())
+    ]
+    mjcf_kwargs = OBJ_CATEGORIES[cat][chosen_reg].get_mjcf_kwargs()
+    mjcf_kwargs["mjcf_path"] = mjcf_path
+    if object_scale is not None:
+        mjcf_kwargs["scale"] *= object_scale
+
+    return mjcf_kwargs, _get_sample_info(groups, cat, split, mjcf_path)
+
+
+def _get_size_mask(sizes, max_size):
+    """
+    Returns which of the given (n, 3) object sizes are within max_size, objects without size never fit a bound.
+    """
+    mask = np.ones(len(sizes), dtype=bool)
+    for i in range(3):
+        if max_size[i] is not None:
+            mask &= sizes[:, i] <= max_size[i]
+    return mask
+
+
+def _normalize_groups(groups, exclude_groups):
+    if not isinstance(groups, tuple) and not isinstance(groups, list):
+        groups = [groups]
+
+    if exclude_groups is None:
+        exclude_groups = []
+    if not isinstance(exclude_groups, tuple) and not isinstance(exclude_groups, list):
+        exclude_groups = [exclude_groups]
+    return groups, exclude_groups
+
+
+@lru_cache(maxsize=None)
+def _get_valid_categories(
+    groups,
+    exclude_groups,
+    graspable=None,
+    washable=None,
+    microwavable=None,
+    cookable=None,
+    freezable=None,
+    obj_registries=("objaverse",),
+):
+    """
+    Returns the categories of the groups that are not excluded, are represented in any of the registries
+    and have all required properties. The result is cached per filter combination, so all arguments have
+    to be hashable (groups and exclude_groups as tuples).
+    """
+    invalid_categories = []
+    for g in exclude_groups:
+        for cat in OBJ_GROUPS[g]:
+            invalid_categories.append(cat)
+
+    valid_categories = []
+    for g in groups:
+        for cat in OBJ_GROUPS[g]:
+            # don't repeat if already added
+            if cat in valid_categories:
+                continue
+            if cat in invalid_categories:
+                continue
+
+            # don't include if category not represented in any registry
+            cat_in_any_reg = np.any(
+                [reg in OBJ_CATEGORIES[cat] for reg in obj_registries]
             )
-            * scale
-        )
-        valid_object_sampled = True
-        for i in range(3):
-            if max_size[i] is not None and obj_size[i] > max_size[i]:
-                valid_object_sampled = False
+            if not cat_in_any_reg:
+                continue
+
+            invalid = False
+            for reg in obj_registries:
+                if reg not in OBJ_CATEGORIES[cat]:
+                    continue
+                cat_meta = OBJ_CATEGORIES[cat][reg]
+                if graspable is True and cat_meta.graspable is not True:
+                    invalid = True
+                if washable is True and cat_meta.washable is not True:
+                    invalid = True
+                if microwavable is True and cat_meta.microwavable is not True:
+                    invalid = True
+                if cookable is True and cat_meta.cookable is not True:
+                    invalid = True
+                if freezable is True and cat_meta.freezable is not True:
+                    invalid = True
+
+            if invalid:
+                continue
+
+            valid_categories.append(cat)
+    return tuple(valid_categories)
+
 
-    return mjcf_kwargs, info
+def _get_split_choices(cat, obj_registries, split):
+    """
+    Returns the mjcf paths and unscaled sizes of a category per registry, restricted to the given split.
+    """
+    choices = {reg: ([], np.zeros((0, 3))) for reg in obj_registries}
+
+    for reg in obj_registries:
+        if reg not in OBJ_CATEGORIES[cat]:
+            continue
+        reg_choices = deepcopy(OBJ_CATEGORIES[cat][reg].mjcf_paths)
+        reg_sizes = OBJ_CATEGORIES[cat][reg].sizes
+
+        # exclude out objects based on split
+        if split is not None:
+            split_th = max(len(choices) - 3, int(math.ceil(len(reg_choices) / 2)))
+            if split == "A":
+                reg_choices = reg_choices[:split_th]
+                reg_sizes = reg_sizes[:split_th]
+            elif split == "B":
+                reg_choices = reg_choices[split_th:]
+                reg_sizes = reg_sizes[split_th:]
+            else:
+                raise ValueError
+        choices[reg] = (reg_choices, reg_sizes)
+    return choices
+
+
+@lru_cache(maxsize=None)
+def _get_mjcf_path_categories(mjcf_path):
+    """
+    Returns the registries the mjcf path appears in per category (in OBJ_CATEGORIES order). Only the categories
+    whose model folders contain the path look up their models, the result is cached per path.
+    """
+    categories = {}
+    for (name, registries) in OBJ_CATEGORIES.items():
+        for (reg, obj_cat) in registries.items():
+            if obj_cat.contains_folder_of(mjcf_path) and mjcf_path in obj_cat.mjcf_paths:
+                categories.setdefault(name, set()).add(reg)
+    return categories
+
+
+def _get_sample_info(groups, cat, split, mjcf_path):
+    return {
+        "groups_containing_sampled_obj": list(CATEGORY_TO_GROUPS.get(cat, [])),
+        "groups": groups,
+        "cat": cat,
+        "split": split,
+        "mjcf_path": mjcf_path,
+    }
 
 
 def sample_kitchen_object_helper(
@@ -297,8 +667,9 @@ def sample_kitchen_object_helper(
     Returns:
         dict: kwargs to apply to the MJCF model for the sampled object
 
-        dict: info about the sampled object - the path of the mjcf, groups which the object's category belongs to, the category of the object
-              the sampling split the object came from, and the groups the object was sampled from
+        dict: info about the sampled object - the path of the mjcf, groups which the object's category belongs to,
+              the category of the object the sampling split the object came from, and the groups the object was
+              sampled from
     """
     if rng is None:
         rng = np.random.default_rng()
@@ -310,12 +681,9 @@ def sample_kitchen_object_helper(
         mjcf_kwargs = dict()
         cat = None
         obj_found = False
-        for cand_cat in OBJ_CATEGORIES:
+        for cand_cat, cand_regs in _get_mjcf_path_categories(mjcf_path).items():
             for reg in obj_registries:
-                if (
-                    reg in OBJ_CATEGORIES[cand_cat]
-                    and mjcf_path in OBJ_CATEGORIES[cand_cat][reg].mjcf_paths
-                ):
+                if reg in cand_regs:
                     mjcf_kwargs = OBJ_CATEGORIES[cand_cat][reg].get_mjcf_kwargs()
                     cat = cand_cat
                     obj_found = True
@@ -326,78 +694,26 @@ def sample_kitchen_object_helper(
             raise ValueError
         mjcf_kwargs["mjcf_path"] = mjcf_path
     else:
-        if not isinstance(groups, tuple) and not isinstance(groups, list):
-            groups = [groups]
-
-        if exclude_groups is None:
-            exclude_groups = []
-        if not isinstance(exclude_groups, tuple) and not isinstance(
-            exclude_groups, list
-        ):
-            exclude_groups = [exclude_groups]
-
-        invalid_categories = []
-        for g in exclude_groups:
-            for cat in OBJ_GROUPS[g]:
-                invalid_categories.append(cat)
-
-        valid_categories = []
-        for g in groups:
-            for cat in OBJ_GROUPS[g]:
-                # don't repeat if already added
-                if cat in valid_categories:
-                    continue
-                if cat in invalid_categories:
-                    continue
-
-                # don't include if category not represented in any registry
-                cat_in_any_reg = np.any(
-                    [reg in OBJ_CATEGORIES[cat] for reg in obj_registries]
-                )
-                if not cat_in_any_reg:
-                    continue
-
-                invalid = False
-                for reg in obj_registries:
-                    if reg not in OBJ_CATEGORIES[cat]:
-                        continue
-                    cat_meta = OBJ_CATEGORIES[cat][reg]
-                    if graspable is True and cat_meta.graspable is not True:
-                        invalid = True
-                    if washable is True and cat_meta.washable is not True:
-                        invalid = True
-                    if microwavable is True and cat_meta.microwavable is not True:
-                        invalid = True
-                    if cookable is True and cat_meta.cookable is not True:
-                        invalid = True
-                    if freezable is True and cat_meta.freezable is not True:
-                        invalid = True
-
-                if invalid:
-                    continue
-
-                valid_categories.append(cat)
+        groups, exclude_groups = _normalize_groups(groups, exclude_groups)
+        valid_categories = _get_valid_categories(
+            tuple(groups),
+            tuple(exclude_groups),
+            graspable=graspable,
+            washable=washable,
+            microwavable=microwavable,
+            cookable=cookable,
+            freezable=freezable,
+            obj_registries=tuple(obj_registries),
+        )
 
         cat = rng.choice(valid_categories)
 
-        choices = {reg: [] for reg in obj_registries}
-
-        for reg in obj_registries:
-            if reg not in OBJ_CATEGORIES[cat]:
-                choices[reg] = []
-                continue
-            reg_choices = deepcopy(OBJ_CATEGORIES[cat][reg].mjcf_paths)
-
-            # exclude out objects based on split
-            if split is not None:
-                split_th = max(len(choices) - 3, int(math.ceil(len(reg_choices) / 2)))
-                if split == "A":
-                    reg_choices = reg_choices[:split_th]
-                elif split == "B":
-                    reg_choices = reg_choices[split_th:]
-                else:
-                    raise ValueError
-            choices[reg] = reg_choices
+        choices = {
+            reg: reg_choices
+            for reg, (reg_choices, _) in _get_split_choices(
+                cat, obj_registries, split
+            ).items()
+        }
 
         chosen_reg = rng.choice(
             obj_registries,
@@ -412,17 +728,4 @@ def sample_kitchen_object_helper(
     if object_scale is not None:
         mjcf_kwargs["scale"] *= object_scale
 
-    groups_containing_sampled_obj = []
-    for group, group_cats in OBJ_GROUPS.items():
-        if cat in group_cats:
-            groups_containing_sampled_obj.append(group)
-
-    info = {
-        "groups_containing_sampled_obj": groups_containing_sampled_obj,
-        "groups": groups,
-        "cat": cat,
-        "split": split,
-        "mjcf_path": mjcf_path,
-    }
-
-    return mjcf_kwargs, info
+    return mjcf_kwargs, _get_sample_info(groups, cat, split, mjcf_path)
@@ -0,0 +1,64 @@
+import hashlib
+import os
+
+import mujoco
+import robosuite
+
+import robocasa
+
+DEFAULT_MODEL_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "robocasa", "models")
+
+
+def get_model_cache_key(xml):
+    """
+    Computes the cache key of a model.
+
+    The final xml already contains the kitchen layout and style, the fixtures and the mjcf paths of all sampled
+    objects, the library versions are added so that updates invalidate the cache.
+
+    Args:
+        xml (str): xml string that would be compiled
+
+    Returns:
+        str: hex digest identifying the compiled model
+    """
+    key = hashlib.sha256()
+    for version in (
+        getattr(robosuite, "__version__", ""),
+        getattr(robocasa, "__version__", ""),
+        mujoco.__version__,
+    ):
+        key.update(version.encode("utf-8"))
+        key.update(b"\0")
+    key.update(xml.encode("utf-8"))
+    return key.hexdigest()
+
+
+def load_or_compile_model(xml, cache_dir=DEFAULT_MODEL_CACHE_DIR):
+    """
+    Loads the compiled model for the xml from the cache, compiles and stores it on a miss.
+
+    Args:
+        xml (str): xml string of the model
+
+        cache_dir (str): directory containing the compiled models
+
+    Returns:
+        mujoco.MjModel: compiled model
+    """
+    path = os.path.join(cache_dir, get_model_cache_key(xml) + ".mjb")
+    if os.path.exists(path):
+        try:
+            return mujoco.MjModel.from_binary_path(path)
+        except Exception:
+            # unreadable or truncated entry, compile again and overwrite it
+            pass
+
+    model = mujoco.MjModel.from_xml_string(xml)
+    os.makedirs(cache_dir, exist_ok=True)
+    # write to a temporary file first so that concurrent processes never load a partially written model
+    tmp_path = "{}.{}.tmp".format(path, os.getpid())
+    mujoco.mj_saveModel(model, tmp_path, None)
+    os.replace(tmp_path, path)
+    return model
+